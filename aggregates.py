@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+RUNNING AGGREGATES
+==================
+
+Count, sum, sum of squares, min and max of every signal, and the number
+of samples of every trouble type, kept per time bucket and in total. The
+store is updated with each ingested batch, so dashboard statistics no
+longer scan the whole frame: the totals are O(1) and a time window costs
+one merge per bucket it covers.
+
+Mean and standard deviation (ddof=1, as pandas) are derived from the
+running sums. Windows are aligned to bucket boundaries: every bucket that
+overlaps the window is counted.
+"""
+
+import bisect
+import threading
+
+import numpy as np
+import pandas as pd
+
+SIGNALS = ['Pressure', 'Temperature', 'DV']
+
+# Width of a bucket
+BUCKET_SECONDS = 60
+
+
+class Bucket:
+    """Running statistics of one bucket (or of a whole window)"""
+
+    def __init__(self, width):
+        self.rows = 0
+        self.count = np.zeros(width, dtype=np.int64)
+        self.total = np.zeros(width)
+        self.squares = np.zeros(width)
+        self.minimum = np.full(width, np.inf)
+        self.maximum = np.full(width, -np.inf)
+        self.troubles = {}
+
+    def merge(self, rows, count, total, squares, minimum, maximum, troubles):
+        self.rows += rows
+        self.count += count
+        self.total += total
+        self.squares += squares
+        np.minimum(self.minimum, minimum, out=self.minimum)
+        np.maximum(self.maximum, maximum, out=self.maximum)
+        for trouble_type, n in troubles.items():
+            self.troubles[trouble_type] = self.troubles.get(trouble_type, 0) + n
+
+    def merge_bucket(self, other):
+        self.merge(other.rows, other.count, other.total, other.squares,
+                   other.minimum, other.maximum, other.troubles)
+
+
+class AggregateStore:
+    """Per-bucket and total running statistics, updated batch by batch"""
+
+    def __init__(self, bucket_seconds=BUCKET_SECONDS, signals=SIGNALS):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_ns = int(bucket_seconds * 1e9)
+        self.signals = list(signals)
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.buckets = {}
+            self.keys = []
+            self.totals = Bucket(len(self.signals))
+
+    def add(self, rows, trouble_types=None):
+        """Fold a batch (frame with Timestamp and the signals) into the store"""
+        if not len(rows):
+            return
+        stamps = pd.DatetimeIndex(rows['Timestamp']).as_unit('ns').asi8
+        keys, inverse = np.unique(stamps // self.bucket_ns, return_inverse=True)
+        n = len(keys)
+
+        width = len(self.signals)
+        count = np.zeros((n, width), dtype=np.int64)
+        total = np.zeros((n, width))
+        squares = np.zeros((n, width))
+        minimum = np.full((n, width), np.inf)
+        maximum = np.full((n, width), -np.inf)
+        for j, signal in enumerate(self.signals):
+            values = np.asarray(rows[signal], dtype=float)
+            present = ~np.isnan(values)
+            where, values = inverse[present], values[present]
+            count[:, j] = np.bincount(where, minlength=n)
+            total[:, j] = np.bincount(where, weights=values, minlength=n)
+            squares[:, j] = np.bincount(where, weights=values * values, minlength=n)
+            np.minimum.at(minimum[:, j], where, values)
+            np.maximum.at(maximum[:, j], where, values)
+        row_counts = np.bincount(inverse, minlength=n)
+
+        troubles = [{} for _ in range(n)]
+        if trouble_types is not None:
+            trouble_types = np.asarray(trouble_types)
+            hits = trouble_types != 'NORMAL'
+            for trouble_type in np.unique(trouble_types[hits]).tolist():
+                per_bucket = np.bincount(inverse[trouble_types == trouble_type], minlength=n)
+                for i in np.flatnonzero(per_bucket).tolist():
+                    troubles[i][trouble_type] = int(per_bucket[i])
+
+        with self._lock:
+            for i, key in enumerate(keys.tolist()):
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = Bucket(width)
+                    bisect.insort(self.keys, key)
+                bucket.merge(int(row_counts[i]), count[i], total[i], squares[i],
+                             minimum[i], maximum[i], troubles[i])
+            self.totals.merge(int(row_counts.sum()), count.sum(axis=0), total.sum(axis=0),
+                              squares.sum(axis=0), minimum.min(axis=0), maximum.max(axis=0),
+                              {t: sum(b.get(t, 0) for b in troubles)
+                               for t in set().union(*troubles)})
+
+    def window(self, start=None, end=None):
+        """Merged statistics of the buckets overlapping [start, end]"""
+        with self._lock:
+            if start is None and end is None:
+                merged = Bucket(len(self.signals))
+                merged.merge_bucket(self.totals)
+                return merged
+            lo = 0 if start is None else bisect.bisect_left(
+                self.keys, pd.Timestamp(start).value // self.bucket_ns)
+            hi = len(self.keys) if end is None else bisect.bisect_right(
+                self.keys, pd.Timestamp(end).value // self.bucket_ns)
+            merged = Bucket(len(self.signals))
+            for key in self.keys[lo:hi]:
+                merged.merge_bucket(self.buckets[key])
+            return merged
+
+    def summary(self, start=None, end=None):
+        """Row count, trouble counts and per-signal statistics for a window"""
+        stats = self.window(start, end)
+        signals = {}
+        for j, signal in enumerate(self.signals):
+            n = int(stats.count[j])
+            mean = stats.total[j] / n if n else 0.0
+            variance = (stats.squares[j] - n * mean * mean) / (n - 1) if n > 1 else 0.0
+            signals[signal] = {
+                'count': n,
+                'mean': float(mean),
+                'std': float(np.sqrt(max(variance, 0.0))),
+                'min': float(stats.minimum[j]) if n else None,
+                'max': float(stats.maximum[j]) if n else None
+            }
+        trouble_count = sum(stats.troubles.values())
+        return {
+            'rows': stats.rows,
+            'trouble_count': trouble_count,
+            'trouble_rate': (trouble_count / stats.rows * 100) if stats.rows else 0.0,
+            'trouble_counts': dict(sorted(stats.troubles.items())),
+            'signals': signals
+        }
@@ -4,13 +4,14 @@ SIMPLE FLASK APP FOR VERCEL DEPLOYMENT
 ======================================
 
 A simplified Flask application to test Vercel deployment.
+
+Reads and checks the data with NumPy only (meter_arrays.py), so the
+deployment does not need pandas or scikit-learn.
 """
 
 from flask import Flask, render_template, jsonify
-import pandas as pd
-import numpy as np
-import json
 from datetime import datetime
+from meter_arrays import read_meter_arrays, detect_troubles, TIMESTAMP
 import warnings
 import os
 warnings.filterwarnings('ignore')
@@ -30,44 +31,13 @@ dashboard_data = {
 def load_and_process_data():
     """Load and process the data for the dashboard"""
     try:
-        # Load data
-        df = pd.read_csv('June18-21_data.csv', parse_dates=['Timestamp'])
-        df = df.dropna()
+        # Load data (rows with missing values are dropped)
+        columns = read_meter_arrays('June18-21_data.csv')
         
-        # Simple trouble detection without ML
-        troubles = []
-        for _, row in df.iterrows():
-            pressure = row['Pressure']
-            temperature = row['Temperature']
-            dv = row['DV']
-            
-            # Simple threshold-based trouble detection
-            if pressure < 0.1 or pressure > 20:
-                troubles.append({
-                    'timestamp': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'pressure': pressure,
-                    'temperature': temperature,
-                    'dv': dv,
-                    'trouble_type': 'PRESSURE_ISSUE'
-                })
-            elif temperature < 20 or temperature > 35:
-                troubles.append({
-                    'timestamp': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'pressure': pressure,
-                    'temperature': temperature,
-                    'dv': dv,
-                    'trouble_type': 'TEMPERATURE_ISSUE'
-                })
-            elif dv < -500 or dv > 500:
-                troubles.append({
-                    'timestamp': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'pressure': pressure,
-                    'temperature': temperature,
-                    'dv': dv,
-                    'trouble_type': 'DV_EXTREME'
-                })
+        # Threshold rules from rules.json (no model, so residual rules are skipped)
+        troubles = detect_troubles(columns)
         
-        return df, troubles
+        return columns, troubles
     except Exception as e:
         print(f"Error loading data: {e}")
         return None, []
@@ -82,14 +52,14 @@ def get_dashboard_data():
     """API endpoint to get dashboard data"""
     try:
         # Load and process data
-        df, troubles = load_and_process_data()
+        columns, troubles = load_and_process_data()
         
-        if df is None:
+        if columns is None:
             return jsonify({'error': 'Failed to load data'}), 500
         
         # Calculate statistics
         trouble_count = len(troubles)
-        total_count = len(df)
+        total_count = len(columns[TIMESTAMP])
         trouble_rate = (trouble_count / total_count * 100) if total_count > 0 else 0
         
         # Determine status
@@ -16,6 +16,10 @@ import io
 import base64
 import json
 from datetime import datetime
+from schema import read_meter_csv
+from detection import detect_troubles
+from rules import active_rules
+from figures import releases_figures
 import warnings
 import os
 warnings.filterwarnings('ignore')
@@ -41,50 +45,24 @@ def load_and_process_data():
     """Load and process the data for the dashboard"""
     try:
         # Load data
-        df = pd.read_csv('June18-21_data.csv', parse_dates=['Timestamp'])
+        df = read_meter_csv('June18-21_data.csv')
         df = df.dropna()
         
-        # Simple trouble detection
-        troubles = []
-        for _, row in df.iterrows():
-            pressure = row['Pressure']
-            temperature = row['Temperature']
-            dv = row['DV']
-            
-            # Simple threshold-based trouble detection
-            if pressure < 0.1 or pressure > 20:
-                troubles.append({
-                    'timestamp': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'pressure': pressure,
-                    'temperature': temperature,
-                    'dv': dv,
-                    'trouble_type': 'PRESSURE_ISSUE'
-                })
-            elif temperature < 20 or temperature > 35:
-                troubles.append({
-                    'timestamp': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'pressure': pressure,
-                    'temperature': temperature,
-                    'dv': dv,
-                    'trouble_type': 'TEMPERATURE_ISSUE'
-                })
-            elif dv < -500 or dv > 500:
-                troubles.append({
-                    'timestamp': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'pressure': pressure,
-                    'temperature': temperature,
-                    'dv': dv,
-                    'trouble_type': 'DV_EXTREME'
-                })
+        # Threshold rules from rules.json (no model, so residual rules are skipped)
+        troubles = detect_troubles(df)
         
         return df, troubles
     except Exception as e:
         print(f"Error loading data: {e}")
         return None, []
 
+@releases_figures
 def create_dashboard_plot(df, troubles):
     """Create the dashboard plot with beautiful wave graphs"""
     try:
+        # Signal behind each trouble type, for the markers and alert text
+        rule_signals = active_rules().signals
+        
         # Create figure
         fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 10))
         fig.suptitle('REAL-TIME SYSTEM MONITORING DASHBOARD', 
@@ -227,13 +205,14 @@ def create_dashboard_plot(df, troubles):
                 t_anomaly_timestamps = []
                 
                 for trouble in troubles[:100]:
-                    if trouble['trouble_type'] in ['PRESSURE_ISSUE', 'TEMPERATURE_ISSUE']:
+                    signal = rule_signals.get(trouble['trouble_type'])
+                    if signal in ['Pressure', 'Temperature']:
                         trouble_time = pd.to_datetime(trouble['timestamp'])
                         time_diff = abs(sample_df['Timestamp'] - trouble_time)
                         if time_diff.min() < pd.Timedelta(minutes=10):
                             closest_idx = time_diff.idxmin()
                             if closest_idx in sample_df.index:
-                                if trouble['trouble_type'] == 'PRESSURE_ISSUE':
+                                if signal == 'Pressure':
                                     p_anomaly_timestamps.append(sample_df.loc[closest_idx, 'Timestamp'])
                                 else:
                                     t_anomaly_timestamps.append(sample_df.loc[closest_idx, 'Timestamp'])
@@ -256,14 +235,14 @@ def create_dashboard_plot(df, troubles):
                 
                 # Plot anomalies with proper timestamps
                 if p_anomaly_timestamps:
-                    p_anomaly_values = [pressure_values[timestamps == ts].iloc[0] if len(pressure_values[timestamps == ts]) > 0 else 0 
+                    p_anomaly_values = [pressure_values[timestamps == ts][0] if len(pressure_values[timestamps == ts]) > 0 else 0 
                                        for ts in p_anomaly_timestamps]
                     ax3.scatter(p_anomaly_timestamps, p_anomaly_values, 
                               color=colors['danger'], s=120, alpha=0.9, zorder=5,
                               edgecolors='white', linewidth=1.5)
                 
                 if t_anomaly_timestamps:
-                    t_anomaly_values = [temperature_values[timestamps == ts].iloc[0] if len(temperature_values[timestamps == ts]) > 0 else 0 
+                    t_anomaly_values = [temperature_values[timestamps == ts][0] if len(temperature_values[timestamps == ts]) > 0 else 0 
                                        for ts in t_anomaly_timestamps]
                     ax3_twin.scatter(t_anomaly_timestamps, t_anomaly_values, 
                                    color=colors['danger'], s=120, alpha=0.9, zorder=5,
@@ -329,11 +308,12 @@ def create_dashboard_plot(df, troubles):
             # Generate alerts
             alert_text = "🚨 ACTIVE ALERTS:\n\n"
             for trouble in troubles[:5]:  # Show first 5
-                if trouble['trouble_type'] == 'PRESSURE_ISSUE':
+                signal = rule_signals.get(trouble['trouble_type'])
+                if signal == 'Pressure':
                     alert_text += f"🔴 Pressure issue: {trouble['pressure']:.2f}\n"
-                elif trouble['trouble_type'] == 'TEMPERATURE_ISSUE':
+                elif signal == 'Temperature':
                     alert_text += f"🟡 Temperature issue: {trouble['temperature']:.1f}°C\n"
-                elif trouble['trouble_type'] == 'DV_EXTREME':
+                elif signal == 'DV':
                     alert_text += f"🔴 Extreme DV value: {trouble['dv']:.1f}\n"
             
             # Add recommendations
@@ -10,247 +10,162 @@ Usage:
     python app.py
 """
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, g, abort, has_request_context
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import os
 os.environ['MPLCONFIGDIR'] = '/tmp'  # Set matplotlib config directory
-import io
+import atexit
 import base64
-from sklearn.linear_model import LinearRegression
-import json
+import hashlib
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from detection import config_fingerprint, status_for
+from incidents import GAP_TOLERANCE
+from meters import fleet_frame, run_fleet_detection, fleet_summary
+from schema import DEFAULT_METER, METER_COLUMN
+from trouble_store import TroubleStore, InvalidCursor, DEFAULT_LIMIT
+from datasets import DatasetManager, DATASETS, UnknownDataset
+from model_registry import MODEL_DIR
+from render import RenderCache, encode_figure, get_profile, mime_type
+from figures import managed_figure, memory_report
+import panels
+from panels import panel_key, panel_state, render_panel
+from correlation import analyze_file, CORRELATION_FILE, MAX_LAG_SECONDS
+from partitioned import PartitionedDataset, DATASET_DIR
+from quantiles import DEFAULT_QUANTILES, summarize
+from rules import active_rules
 from datetime import datetime
+from urllib.parse import quote
 import warnings
-import os
 warnings.filterwarnings('ignore')
 
 app = Flask(__name__)
 
+DATA_FILE = os.environ.get('DATA_FILE', 'June18-21_data.csv')
+
+# Scored rows kept uncompressed; older readings stay in the compressed history
+HOT_ROWS = int(os.environ['HOT_ROWS']) if os.environ.get('HOT_ROWS') else None
+
+# /debug/* endpoints expose process internals; off unless explicitly enabled
+# (app.debug cannot gate them, it is forced on for deployment below)
+DEBUG_ENDPOINTS = os.environ.get('DEBUG_ENDPOINTS') == '1'
+
 # Global variables to store dashboard data
 dashboard_data = {
     'status': 'NORMAL',
     'trouble_count': 0,
+    'incident_count': 0,
     'total_count': 0,
     'trouble_rate': 0.0,
     'alerts': [],
     'recommendations': []
 }
 
+# Encoded dashboard images keyed by (data version, render profile),
+# and panel images keyed by ('panel', name, panel key, render profile)
+image_cache = RenderCache()
+
+# Renders dashboard panels concurrently
+panel_renderer = ThreadPoolExecutor(max_workers=len(panels.PANELS))
+
+# Per-meter detection results: dataset name -> ((epoch, version), {meter id: result});
+# no pipeline reference, so evicting a dataset frees its memory
+fleet_results = {}
+
+# Worker processes for fleet detection, started on first use and reused
+fleet_pool = None
+fleet_pool_lock = threading.Lock()
+
+# Persistent store of detected troubles and incidents
+trouble_store = TroubleStore()
+
+# Load epoch whose troubles are in the store, per data file
+persisted_epochs = {}
+
+# Model, troubles and incidents per data file, updated as rows are appended;
+# DATA_FILE is the default, other registered files are served with ?dataset=.
+# Each dataset has its own versioned DV models (MODEL_DIR/<dataset>/); an
+# active version replaces per-process training for that dataset only
+datasets = DatasetManager(DATASETS, default=DATA_FILE, model_dir=MODEL_DIR, hot_rows=HOT_ROWS)
+
+# Day-partitioned history (python partitioned.py ingest ...), opened per query
+history = PartitionedDataset(DATASET_DIR)
+
+def current_dataset():
+    """Name of the dataset requested with ?dataset= (the default one outside requests)"""
+    if has_request_context():
+        return request.args.get('dataset') or datasets.default
+    return datasets.default
+
+def current_pipeline():
+    """Pipeline of the current dataset, fixed for the duration of a request"""
+    if not has_request_context():
+        return datasets.get()
+    if 'pipeline' not in g:
+        g.pipeline = datasets.get(current_dataset())
+    return g.pipeline
+
 def load_and_process_data():
     """Load and process the data for the dashboard"""
+    pipeline = current_pipeline()
     try:
-        # Load data
-        df = pd.read_csv('June18-21_data.csv', parse_dates=['Timestamp'])
-        df = df.dropna()
+        # Parse only the rows appended since the last refresh
+        with pipeline._lock:
+            batch = pipeline.refresh()
+            epoch = pipeline.epoch
         
-        # Train model
-        X = df[['Pressure', 'Temperature']]
-        y = df['DV']
+        # Evict least recently viewed datasets beyond the memory budget
+        datasets.fit_budget(keep=pipeline)
         
-        model = LinearRegression()
-        model.fit(X, y)
+        if batch is not None and datasets.is_default(pipeline):
+            # Persist the new troubles and the incidents they started or extended
+            rows, trouble_types = batch
+            batch_start = rows['Timestamp'].min().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            if persisted_epochs.get(pipeline.path) != epoch:
+                # Rescored from scratch (new model, rules or file): replace
+                # what was stored for these meters over the rescored range
+                batch_end = rows['Timestamp'].max().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+                meter_ids = (rows[METER_COLUMN].astype(str).unique().tolist()
+                             if METER_COLUMN in rows else [DEFAULT_METER])
+                trouble_store.delete_range(meter_ids, batch_start, batch_end)
+                persisted_epochs[pipeline.path] = epoch
+            trouble_store.save_troubles(rows, trouble_types)
+            trouble_store.save_incidents(
+                [i for i in pipeline.incidents if i['end'] >= batch_start])
         
-        # Calculate residuals
-        df['DV_predicted'] = model.predict(X)
-        df['Residual'] = df['DV'] - df['DV_predicted']
-        residual_std = df['Residual'].std()
+        if pipeline.model is None:
+            return None, None, None
         
-        return df, model, residual_std
+        return pipeline.df, pipeline.model, pipeline.residual_std
     except Exception as e:
         print(f"Error loading data: {e}")
         return None, None, None
 
-def detect_troubles(df, residual_std):
-    """Detect troubles in the data"""
-    troubles = []
-    
-    for _, row in df.iterrows():
-        # Detect trouble indicators
-        pressure = row['Pressure']
-        temperature = row['Temperature']
-        dv = row['DV']
-        residual = row['Residual']
-        
-        # Check for trouble
-        has_trouble = False
-        trouble_type = "NORMAL"
-        
-        # High residual
-        if abs(residual) > 2 * residual_std:
-            has_trouble = True
-            trouble_type = "HIGH_ANOMALY"
-        
-        # Pressure issues
-        elif pressure < 0.1:
-            has_trouble = True
-            trouble_type = "LOW_PRESSURE"
-        elif pressure > 20:
-            has_trouble = True
-            trouble_type = "HIGH_PRESSURE"
-        
-        # Temperature issues
-        elif temperature < 20:
-            has_trouble = True
-            trouble_type = "LOW_TEMPERATURE"
-        elif temperature > 35:
-            has_trouble = True
-            trouble_type = "HIGH_TEMPERATURE"
-        
-        # DV range issues
-        elif dv < -500 or dv > 500:
-            has_trouble = True
-            trouble_type = "EXTREME_DV"
-        
-        if has_trouble:
-            troubles.append({
-                'timestamp': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                'pressure': pressure,
-                'temperature': temperature,
-                'dv': dv,
-                'trouble_type': trouble_type
-            })
-    
-    return troubles
-
-def create_dashboard_plot(df, troubles):
-    """Create the dashboard plot"""
+def create_dashboard_plot(df, incidents, trouble_count, profile=None, total_count=None):
+    """Create the dashboard plot, encoded with the given render profile"""
     try:
-        # Create figure
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 10))
-        fig.suptitle('REAL-TIME SYSTEM MONITORING DASHBOARD', 
-                     fontsize=16, fontweight='bold')
+        # Status comes from incidents; the rate counts trouble samples
+        state = panel_state(df, incidents, trouble_count, total_count=total_count)
+        status = status_for(len(incidents))
+        trouble_rate = panels.trouble_rate(state)
         
-        # Colors
-        colors = {
-            'normal': '#27ae60',
-            'warning': '#f39c12', 
-            'danger': '#e74c3c',
-            'primary': '#3498db',
-            'success': '#2ecc71'
-        }
-        
-        # Determine status
-        trouble_count = len(troubles)
-        total_count = len(df)
-        trouble_rate = (trouble_count / total_count * 100) if total_count > 0 else 0
-        
-        if trouble_count == 0:
-            status = "NORMAL"
-            status_color = colors['success']
-            status_icon = "✅"
-        elif trouble_count <= 50:
-            status = "ATTENTION"
-            status_color = colors['warning']
-            status_icon = "⚠️"
-        else:
-            status = "TROUBLE"
-            status_color = colors['danger']
-            status_icon = "🚨"
-        
-        # 1. Status Panel
-        ax1.set_facecolor(status_color)
-        ax1.text(0.5, 0.5, f"{status_icon}\n{status}\nTroubles: {trouble_count}\nRate: {trouble_rate:.1f}%", 
-                transform=ax1.transAxes, fontsize=16, fontweight='bold', 
-                ha='center', va='center', color='white')
-        ax1.set_title('SYSTEM STATUS', fontsize=14, fontweight='bold')
-        ax1.axis('off')
-        
-        # 2. DV Wave Graph
-        if len(df) > 0:
-            # Sample data for visualization
-            sample_size = min(200, len(df))
-            sample_df = df.sample(n=sample_size, random_state=42).sort_values('Timestamp')
-            
-            timestamps = sample_df['Timestamp']
-            dv_values = sample_df['DV']
-            predicted_values = sample_df['DV_predicted']
-            
-            ax2.plot(timestamps, dv_values, color=colors['primary'], 
-                    label='Actual DV', linewidth=2, alpha=0.9)
-            ax2.plot(timestamps, predicted_values, color=colors['success'], 
-                    label='Expected DV', linewidth=2, linestyle='--', alpha=0.8)
+        # The figure is closed even if drawing or encoding fails
+        with managed_figure(2, 2, figsize=(16, 10)) as (fig, axes):
+            fig.suptitle('REAL-TIME SYSTEM MONITORING DASHBOARD', 
+                         fontsize=16, fontweight='bold')
             
-            # Highlight trouble points
-            trouble_timestamps = [t['timestamp'] for t in troubles[:20]]  # Show first 20
-            if trouble_timestamps:
-                trouble_dvs = [t['dv'] for t in troubles[:20]]
-                ax2.scatter(trouble_timestamps, trouble_dvs, color=colors['danger'], 
-                          s=100, label='Trouble Detected', alpha=0.9, zorder=5)
+            for ax, name in zip(axes.flat, panels.PANELS):
+                panels.PANEL_DRAWERS[name](ax, state)
             
-            ax2.set_title('DV Values Wave Graph', fontsize=12, fontweight='bold')
-            ax2.set_xlabel('Time')
-            ax2.set_ylabel('DV Value')
-            ax2.legend(loc='upper left')
-            ax2.grid(True, alpha=0.3)
-            plt.setp(ax2.get_xticklabels(), rotation=45, ha='right')
+            # Encode the plot
+            fig.tight_layout()
+            image = encode_figure(fig, profile)
         
-        # 3. Pressure & Temperature Graph
-        if len(df) > 0:
-            ax3_twin = ax3.twinx()
-            
-            line1 = ax3.plot(timestamps, sample_df['Pressure'], 
-                            color=colors['primary'], label='Pressure', linewidth=2, alpha=0.9)
-            line2 = ax3_twin.plot(timestamps, sample_df['Temperature'], 
-                                 color=colors['danger'], label='Temperature', linewidth=2, alpha=0.9)
-            
-            ax3.set_ylabel('Pressure', color=colors['primary'], fontweight='bold')
-            ax3_twin.set_ylabel('Temperature (°C)', color=colors['danger'], fontweight='bold')
-            ax3.tick_params(axis='y', labelcolor=colors['primary'])
-            ax3_twin.tick_params(axis='y', labelcolor=colors['danger'])
-            
-            ax3.set_title('Pressure & Temperature Wave Graph', fontsize=12, fontweight='bold')
-            ax3.set_xlabel('Time')
-            ax3.grid(True, alpha=0.3)
-            
-            lines = line1 + line2
-            labels = [l.get_label() for l in lines]
-            ax3.legend(lines, labels, loc='upper left')
-            plt.setp(ax3.get_xticklabels(), rotation=45, ha='right')
-        
-        # 4. Alerts Panel
-        if trouble_count == 0:
-            alert_text = "✅ NO ACTIVE ALERTS\n\nSystem operating normally"
-        else:
-            # Generate alerts
-            alert_text = "🚨 ACTIVE ALERTS:\n\n"
-            for trouble in troubles[:5]:  # Show first 5
-                if trouble['trouble_type'] == 'HIGH_ANOMALY':
-                    alert_text += f"🔴 DV anomaly detected\n"
-                elif trouble['trouble_type'] == 'LOW_PRESSURE':
-                    alert_text += f"🟡 Low pressure: {trouble['pressure']:.2f}\n"
-                elif trouble['trouble_type'] == 'HIGH_PRESSURE':
-                    alert_text += f"🔴 High pressure: {trouble['pressure']:.2f}\n"
-                elif trouble['trouble_type'] == 'LOW_TEMPERATURE':
-                    alert_text += f"🟡 Low temperature: {trouble['temperature']:.1f}°C\n"
-                elif trouble['trouble_type'] == 'HIGH_TEMPERATURE':
-                    alert_text += f"🔴 High temperature: {trouble['temperature']:.1f}°C\n"
-                elif trouble['trouble_type'] == 'EXTREME_DV':
-                    alert_text += f"🔴 Extreme DV value: {trouble['dv']:.1f}\n"
-            
-            # Add recommendations
-            alert_text += "\n🔧 RECOMMENDED ACTIONS:\n"
-            alert_text += "• Check sensor readings\n"
-            alert_text += "• Monitor system parameters\n"
-            alert_text += "• Review recent changes\n"
-        
-        ax4.text(0.05, 0.95, alert_text, transform=ax4.transAxes, fontsize=10,
-                va='top', bbox=dict(boxstyle="round,pad=0.3", 
-                facecolor=colors['danger'] if trouble_count > 0 else colors['success'], alpha=0.7))
-        ax4.set_title('ALERTS & RECOMMENDATIONS', fontsize=12, fontweight='bold')
-        ax4.axis('off')
-        
-        # Save plot to base64 string
-        plt.tight_layout()
-        img = io.BytesIO()
-        plt.savefig(img, format='png', dpi=150, bbox_inches='tight')
-        img.seek(0)
-        plot_url = base64.b64encode(img.getvalue()).decode()
-        plt.close()
-        
-        return plot_url, status, trouble_count, trouble_rate
+        return image, status, trouble_count, trouble_rate
         
     except Exception as e:
         print(f"Error creating plot: {e}")
@@ -259,42 +174,425 @@ def create_dashboard_plot(df, troubles):
 @app.route('/')
 def dashboard():
     """Main dashboard page"""
+    if request.args.get('dataset'):
+        try:
+            datasets.get(request.args['dataset'])
+        except UnknownDataset as e:
+            return jsonify({'error': str(e)}), 404
+        return render_template('dashboard.html', data_url=with_dataset('/api/dashboard-data?layout=panels'))
     return render_template('dashboard.html')
 
+def with_dataset(url):
+    """url for the dataset of the current request"""
+    if has_request_context() and request.args.get('dataset'):
+        return f"{url}&dataset={quote(request.args['dataset'])}"
+    return url
+
+class DashboardError(Exception):
+    """Raised when the dashboard data cannot be produced"""
+
+def render_dashboard_image(profile=None):
+    """Dashboard image for the current data, rendered once per data version and profile"""
+    profile, _ = get_profile(profile)
+    pipeline = current_pipeline()
+    
+    # Load and process data
+    df, model, residual_std = load_and_process_data()
+    
+    if df is None:
+        raise DashboardError('Failed to load data')
+    
+    def render():
+        image, _, _, _ = create_dashboard_plot(
+            df, pipeline.incidents, pipeline.trouble_count, profile, pipeline.total_count)
+        if image is None:
+            raise DashboardError('Failed to create plot')
+        return image
+    
+    return image_cache.get_or_render((data_version(), profile), render)
+
+def current_panel_state():
+    """Panel inputs for the current pipeline state"""
+    pipeline = current_pipeline()
+    df, model, residual_std = load_and_process_data()
+    
+    if df is None:
+        raise DashboardError('Failed to load data')
+    
+    return panel_state(df, pipeline.incidents, pipeline.trouble_count, pipeline.fingerprint(),
+                       pipeline.total_count)
+
+def render_panel_image(name, key, state, profile):
+    """One panel image, rendered only when its key changed"""
+    return image_cache.get_or_render(('panel', name, key, profile),
+                                     lambda: render_panel(name, state, profile))
+
+def panel_urls(keys, profile):
+    """Versioned /api/panel URLs for {name: key}"""
+    return [{'name': name, 'url': with_dataset(f"/api/panel/{name}?quality={profile}&v={key}")}
+            for name, key in keys.items()]
+
+def render_panels(profile=None):
+    """Render every panel whose inputs changed, concurrently; returns {name: key}"""
+    profile, _ = get_profile(profile)
+    state = current_panel_state()
+    keys = {name: panel_key(name, state) for name in panels.PANELS}
+    list(panel_renderer.map(lambda name: render_panel_image(name, keys[name], state, profile),
+                            panels.PANELS))
+    return keys
+
+def build_dashboard_data(profile=None, layout='full'):
+    """Run the pipeline and return the updated dashboard data
+    
+    The 'full' layout embeds the whole dashboard image; the 'panels'
+    layout lists versioned /api/panel URLs instead.
+    """
+    profile, _ = get_profile(profile)
+    if layout == 'panels':
+        images = {'panels': panel_urls(render_panels(profile), profile)}
+    elif layout == 'full':
+        images = {
+            'plot_url': base64.b64encode(render_dashboard_image(profile)).decode(),
+            'plot_mime': mime_type(profile)
+        }
+    else:
+        raise ValueError(f"Unknown layout: {layout} (choose from full, panels)")
+    
+    # Troubles, incidents and running aggregates are maintained incrementally by the pipeline
+    pipeline = current_pipeline()
+    summary = pipeline.aggregates.summary()
+    total_count = summary['rows']
+    trouble_count = summary['trouble_count']
+    incidents = pipeline.incidents
+    trouble_rate = summary['trouble_rate']
+    status = status_for(len(incidents))
+    
+    # Update global data
+    dashboard_data.update({
+        'status': status,
+        'trouble_count': trouble_count,
+        'incident_count': len(incidents),
+        'total_count': total_count,
+        'trouble_rate': trouble_rate,
+        'alerts': incidents[:10],  # Show first 10 incidents
+        'render_profile': profile,
+        'dataset': current_dataset(),
+        'cursor': pipeline.cursor()
+    })
+    
+    return {**dashboard_data, **images}
+
+def data_version():
+    """ETag for the current data file state and detection configuration"""
+    key = f"{current_pipeline().fingerprint()}|{config_fingerprint()}|{GAP_TOLERANCE.value}"
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
 @app.route('/api/dashboard-data')
 def get_dashboard_data():
     """API endpoint to get dashboard data"""
     try:
-        # Load and process data
-        df, model, residual_std = load_and_process_data()
+        # Cheap when the file is unchanged: only appended rows are parsed
+        load_and_process_data()
         
-        if df is None:
-            return jsonify({'error': 'Failed to load data'}), 500
+        profile, _ = get_profile(request.args.get('quality'))
+        layout = request.args.get('layout', 'full')
         
-        # Detect troubles
-        troubles = detect_troubles(df, residual_std)
+        # Delta since the client's cursor; stale cursors get the full payload
+        since = request.args.get('since')
+        if since is not None:
+            delta = current_pipeline().changes_since(since)
+            if delta is not None:
+                counters = delta['counters']
+                total_count = counters['total_count']
+                counters['trouble_rate'] = (counters['trouble_count'] / total_count * 100) if total_count > 0 else 0
+                counters['status'] = status_for(counters['incident_count'])
+                if layout == 'panels':
+                    # Panel versions only; the page refetches the panels whose version changed
+                    state = current_panel_state()
+                    delta['panels'] = panel_urls({name: panel_key(name, state) for name in panels.PANELS},
+                                                 profile)
+                return jsonify({'delta': True, **delta})
         
-        # Create dashboard plot
-        plot_url, status, trouble_count, trouble_rate = create_dashboard_plot(df, troubles)
+        etag = f"{data_version()}-{profile}-{layout}"
         
-        if plot_url is None:
-            return jsonify({'error': 'Failed to create plot'}), 500
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            # Images are only re-rendered when the data or configuration changed
+            response = jsonify(build_dashboard_data(profile, layout))
+            etag = f"{data_version()}-{profile}-{layout}"
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/dashboard-image')
+def get_dashboard_image():
+    """Dashboard image as a plain image response (no base64 JSON wrapping)"""
+    try:
+        profile, _ = get_profile(request.args.get('quality'))
+        load_and_process_data()
+        etag = f"{data_version()}-{profile}"
+        
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            response = Response(render_dashboard_image(profile), mimetype=mime_type(profile))
+            etag = f"{data_version()}-{profile}"
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/panel/<name>')
+def get_panel(name):
+    """One dashboard panel as an image, cached by the inputs that panel draws"""
+    try:
+        if name not in panels.PANELS:
+            return jsonify({'error': f'Unknown panel: {name}'}), 404
+        profile, _ = get_profile(request.args.get('quality'))
+        state = current_panel_state()
+        key = panel_key(name, state)
+        etag = f"{key}-{profile}"
+        
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            response = Response(render_panel_image(name, key, state, profile),
+                                mimetype=mime_type(profile))
         
-        # Update global data
-        dashboard_data.update({
-            'status': status,
-            'trouble_count': trouble_count,
-            'total_count': len(df),
-            'trouble_rate': trouble_rate,
-            'alerts': troubles[:10],  # Show first 10 alerts
-            'plot_url': plot_url
+        response.set_etag(etag, weak=True)
+        if request.args.get('v') == key:
+            # Versioned URLs always name the same image
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def get_fleet_pool():
+    """The fleet worker pool, started on first use
+
+    Workers come from a forkserver, not a fork of this threaded process,
+    so they never inherit a lock (e.g. PYPLOT_LOCK) held by a render thread.
+    """
+    global fleet_pool
+    with fleet_pool_lock:
+        if fleet_pool is None:
+            fleet_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('forkserver'))
+            atexit.register(fleet_pool.shutdown)
+        return fleet_pool
+
+def refresh_fleet():
+    """Per-meter detection across the fleet of the current dataset, rerun once per data version"""
+    df, model, residual_std = load_and_process_data()
+    if df is None:
+        raise DashboardError(f'No data for dataset {current_dataset()}')
+    pipeline = current_pipeline()
+    with pipeline._lock:
+        key = (pipeline.epoch, pipeline.version)
+        cached = fleet_results.get(current_dataset())
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        readings = pipeline.readings()
+    results = run_fleet_detection(fleet_frame(readings), executor=get_fleet_pool())
+    fleet_results[current_dataset()] = (key, results)
+    return results
+
+@app.route('/api/fleet')
+def get_fleet_data():
+    """API endpoint for the fleet-wide summary across all meters"""
+    try:
+        return jsonify(fleet_summary(refresh_fleet()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except DashboardError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/meters/<meter_id>')
+def get_meter_data(meter_id):
+    """API endpoint for a single meter's drill-down"""
+    try:
+        results = refresh_fleet()
+        if meter_id not in results:
+            return jsonify({'error': f'Unknown meter: {meter_id}'}), 404
+        return jsonify(results[meter_id])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except DashboardError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/troubles')
+def get_troubles():
+    """API endpoint for paginated historical troubles or incidents"""
+    try:
+        items, next_cursor = trouble_store.query(
+            kind=request.args.get('kind', 'troubles'),
+            trouble_type=request.args.get('type'),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', DEFAULT_LIMIT, type=int),
+            meter_id=request.args.get('meter'))
+        return jsonify({'items': items, 'count': len(items), 'next_cursor': next_cursor})
+    except (InvalidCursor, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/summary')
+def get_summary():
+    """Signal statistics and trouble counts for a time window, from the running aggregates"""
+    try:
+        load_and_process_data()
+        pipeline = current_pipeline()
+        start, end = request.args.get('start'), request.args.get('end')
+        summary = pipeline.aggregates.summary(start, end)
+        return jsonify({'start': start, 'end': end,
+                        'bucket_seconds': pipeline.aggregates.bucket_seconds, **summary})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/quantiles')
+def get_quantiles():
+    """Streaming quantiles, median and MAD of the residual and signals, with the rule limits they give"""
+    try:
+        load_and_process_data()
+        pipeline = current_pipeline()
+        quantiles = ([float(q) for q in request.args['q'].split(',')]
+                     if request.args.get('q') else DEFAULT_QUANTILES)
+        if any(not 0 <= q <= 1 for q in quantiles):
+            raise ValueError('Quantiles must be between 0 and 1')
+        signals = request.args['signal'].split(',') if request.args.get('signal') else list(pipeline.quantiles)
+        unknown = [s for s in signals if s not in pipeline.quantiles]
+        if unknown:
+            raise ValueError(f"Unknown signal: {', '.join(unknown)} (choose from {', '.join(pipeline.quantiles)})")
+        params = pipeline.detection_params()
+        return jsonify({
+            'dataset': current_dataset(),
+            'signals': {signal: summarize(pipeline.quantiles[signal], quantiles) for signal in signals},
+            'parameters': params,
+            'limits': active_rules().limits(params)
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history')
+def get_history():
+    """Readings for a time range from the partitioned history, downsampled
+
+    Without a partitioned dataset, the live file's compressed in-memory
+    history is queried instead.
+    """
+    try:
+        start, end = request.args.get('start'), request.args.get('end')
+        meter = request.args.get('meter')
+        max_points = max(1, request.args.get('max_points', 500, type=int))
+        last = request.args.get('last', 3600, type=float)
         
-        return jsonify(dashboard_data)
+        if history.exists():
+            # Without a range, the latest window only touches the newest partitions
+            if start is None and end is None:
+                start, end = history.latest_window(last, meter)
+            df = history.read(start, end, meter)
+            partitions = len(history.partitions(start, end, meter))
+        else:
+            load_and_process_data()
+            pipeline = current_pipeline()
+            if not len(pipeline.history):
+                return jsonify({'error': f'No partitioned dataset in {DATASET_DIR}'}), 404
+            if start is None and end is None:
+                end = pipeline.history.last(1)['Timestamp'].iloc[0]
+                start = end - pd.Timedelta(seconds=last)
+            df = pipeline.history.read(start, end)
+            if meter is not None and 'MeterID' in df.columns:
+                df = df[df['MeterID'] == meter]
+            partitions = None
         
+        stride = max(1, -(-len(df) // max_points))
+        sample = df.iloc[::stride]
+        return jsonify({
+            'start': str(start) if start is not None else None,
+            'end': str(end) if end is not None else None,
+            'meter': meter,
+            'rows': len(df),
+            'stride': stride,
+            'partitions': partitions,
+            'timestamp': [t[:-3] for t in sample['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S.%f')],
+            'dv': sample['DV'].tolist(),
+            'pressure': sample['Pressure'].tolist(),
+            'temperature': sample['Temperature'].tolist()
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/datasets')
+def get_datasets():
+    """Registered datasets (?dataset=<name>), which are cached and their measured memory"""
+    try:
+        return jsonify(datasets.info())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/correlation')
+def get_correlation():
+    """API endpoint for lagged Pressure/Temperature to DV correlation"""
+    try:
+        max_lag = request.args.get('max_lag', MAX_LAG_SECONDS, type=float)
+        if not math.isfinite(max_lag) or max_lag < 0:
+            return jsonify({'error': 'max_lag must be a finite number of seconds >= 0'}), 400
+        return jsonify(analyze_file(CORRELATION_FILE, max_lag))
+    except FileNotFoundError:
+        return jsonify({'error': f'{CORRELATION_FILE} not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/models')
+def get_models():
+    """API endpoint listing the current dataset's saved model versions and the active one"""
+    try:
+        registry = datasets.registry(current_dataset())
+        return jsonify({
+            'dataset': current_dataset(),
+            'directory': registry.directory,
+            'active': registry.active_version(),
+            'versions': [registry.artifact(v) for v in registry.versions()]
+        })
+    except UnknownDataset as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/debug/memory')
+def debug_memory():
+    """Open figures, RSS and top tracemalloc allocators (run with PYTHONTRACEMALLOC=1)"""
+    if not DEBUG_ENDPOINTS:
+        abort(404)
+    return jsonify(memory_report(request.args.get('limit', 10, type=int)))
+
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
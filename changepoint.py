@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+CHANGE-POINT DETECTION
+======================
+
+Point rules compare every sample with a threshold, so a meter whose
+residual drifts by one or two standard deviations never trips them. This
+stage runs a two-sided CUSUM on the standardized residual of each meter:
+
+    z   = clip((Residual - residual_median) / residual_mad, -CLIP, CLIP)
+    S+  = max(0, S+ + z - k)        S- = max(0, S- - z - k)
+
+residual_std stands in for a MAD of 0 or NaN, as it does for the rules.
+
+A sustained shift of more than k sigmas makes S climb until it passes h
+and the meter is reported as drifting. The onset is the last sample where
+S was zero, the end the sample where S peaked (the shift stopped adding
+up), so each excursion of S above h becomes one DRIFT incident with its
+onset, detection time and direction. Clipping z keeps single spikes
+(already caught by the point rules) from tripping it on their own.
+
+The recursion is evaluated without a Python loop over rows: with
+C = S0 + cumsum(z - k), S = C - min(0, running min of C). The statistic,
+onset and peak carry over between batches, so incremental runs on newly
+appended rows give the same incidents as one run over the whole file,
+as long as every batch is standardized with the same median and MAD.
+LivePipeline fixes them when it fits (or loads) its model; a median and
+MAD that moved with every batch would make the result depend on where
+the batches split.
+
+pelt() is an offline alternative for historical analysis: exact
+segmentation of a series into constant-mean pieces (PELT with a
+squared-error cost), usually run on block means of the residual.
+
+Usage:
+    python changepoint.py data.csv [--batch 1000]            # streaming CUSUM
+    python changepoint.py data.csv --pelt [--block 60] [--penalty P]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from rules import scale_parameter
+from schema import METER_COLUMN
+
+DRIFT = 'DRIFT'
+
+# k: half the smallest shift worth reporting, in robust sigmas
+CUSUM_ALLOWANCE = 0.5
+
+# h: alarm level of the CUSUM statistic (sigma-samples); residuals are
+# strongly autocorrelated, so noise alone reaches ~10
+CUSUM_THRESHOLD = 20.0
+
+# Alarm level of each detector's peak statistic, for severity scoring
+DETECTOR_THRESHOLDS = {DRIFT: CUSUM_THRESHOLD}
+
+# Standardized residuals are clipped to +-CLIP before accumulating
+CUSUM_CLIP = 4.0
+
+# Rows per block mean for the offline segmentation
+PELT_BLOCK = 60
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+DIRECTIONS = {'up': 1.0, 'down': -1.0}
+
+
+def _format_time(value):
+    return pd.Timestamp(value).strftime(TIME_FORMAT)[:-3]
+
+
+def cusum(increments, start=0.0):
+    """S_t = max(0, S_{t-1} + increments_t) from S_0 = start, vectorized"""
+    running = start + np.cumsum(increments)
+    return running - np.minimum(np.minimum.accumulate(running), 0.0)
+
+
+def standardize(residuals, params, clip=CUSUM_CLIP):
+    """Residuals in robust sigmas around the median, clipped"""
+    scale = scale_parameter(params, 'residual_mad')
+    z = (np.asarray(residuals, dtype=float) - params['residual_median']) / scale
+    return np.clip(z, -clip, clip)
+
+
+class CusumDetector:
+    """Two-sided CUSUM per meter, carried across batches"""
+
+    def __init__(self, allowance=CUSUM_ALLOWANCE, threshold=CUSUM_THRESHOLD, clip=CUSUM_CLIP):
+        self.allowance = allowance
+        self.threshold = threshold
+        self.clip = clip
+        # meter -> rows seen
+        self.rows = {}
+        # (meter, direction) -> statistic and the excursion in progress
+        self.state = {}
+
+    def statistics(self):
+        """Current S+ / S- of every meter"""
+        return {f"{meter}:{direction}": state['S'] for (meter, direction), state in self.state.items()}
+
+    def update(self, rows, params):
+        """DRIFT incidents started or extended by a batch (rows with Residual)
+
+        params holds residual_median and residual_mad (residual_std is used
+        when the MAD is 0 or NaN); nothing is reported without a usable scale.
+        """
+        if not len(rows) or scale_parameter(params, 'residual_mad') is None or \
+                params.get('residual_median') is None:
+            return []
+        z = standardize(rows['Residual'].to_numpy(), params, self.clip)
+        if METER_COLUMN in rows:
+            meters = rows[METER_COLUMN].astype(str).to_numpy()
+            groups = [(meter, np.flatnonzero(meters == meter)) for meter in pd.unique(meters)]
+        else:
+            groups = [(None, np.arange(len(rows)))]
+
+        incidents = []
+        for meter, positions in groups:
+            offset = self.rows.get(meter, 0)
+            meter_rows = rows if len(positions) == len(rows) else rows.iloc[positions]
+            for direction, sign in DIRECTIONS.items():
+                state = self.state.setdefault((meter, direction), {
+                    'S': 0.0, 'zero': -1, 'onset': None, 'max': 0.0, 'detected': None, 'counted': None})
+                incidents += self._advance(state, sign * z[positions] - self.allowance,
+                                           meter_rows, offset, meter, direction)
+            self.rows[meter] = offset + len(positions)
+        incidents.sort(key=lambda incident: incident['start'])
+        return incidents
+
+    def _advance(self, state, increments, rows, offset, meter, direction):
+        S = cusum(increments, state['S'])
+        index = offset + np.arange(len(S))
+        zero = S <= 0
+        last_zero = np.maximum(np.maximum.accumulate(np.where(zero, index, -1)), state['zero'])
+        carried = state['S'] > 0 and not zero[0]
+
+        # Excursions: runs of S > 0, identified by the last zero before them
+        positive = np.flatnonzero(~zero)
+        incidents = []
+        if len(positive):
+            ids = last_zero[positive]
+            starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+            ends = np.append(starts[1:], len(positive))
+            peaks = np.maximum.reduceat(S[positive], starts)
+            for j in np.flatnonzero(peaks > self.threshold).tolist():
+                incident = self._excursion(state if j == 0 and carried else None, S,
+                                           positive[starts[j]:ends[j]], int(ids[starts[j]]),
+                                           rows, index, meter, direction)
+                if incident is not None:
+                    incidents.append(incident)
+
+        # Remember the excursion still open at the end of the batch
+        if zero[-1]:
+            state.update({'onset': None, 'max': 0.0, 'detected': None, 'counted': None})
+        elif not carried or last_zero[-1] != state['zero']:
+            state.update(self._open_state(S, positive[starts[-1]:], rows, index))
+        state['S'] = float(S[-1])
+        state['zero'] = int(last_zero[-1])
+        return incidents
+
+    def _open_state(self, S, span, rows, index):
+        """State of an excursion that started in this batch and is still open"""
+        peak = span[np.argmax(S[span])]
+        above = span[S[span] > self.threshold]
+        return {
+            'onset': _format_time(rows['Timestamp'].iloc[span[0]]),
+            'max': float(S[peak]),
+            'detected': _format_time(rows['Timestamp'].iloc[above[0]]) if len(above) else None,
+            'counted': int(index[peak]) if len(above) else None
+        }
+
+    def _excursion(self, carried, S, span, zero, rows, index, meter, direction):
+        """Incident (fragment) for one excursion, or None if it did not peak higher
+
+        carried is the state of an excursion that started in an earlier
+        batch, updated in place; zero is the global index of the last row
+        with S = 0 before it, so the onset is row zero + 1.
+        """
+        peak = span[np.argmax(S[span])]
+        if carried is not None and S[peak] <= carried['max']:
+            return None
+
+        timestamps = rows['Timestamp']
+        onset = carried['onset'] if carried is not None else _format_time(timestamps.iloc[span[0]])
+        detected = carried['detected'] if carried is not None else None
+        if detected is None:
+            detected = _format_time(timestamps.iloc[span[S[span] > self.threshold][0]])
+        # Samples from the onset (or the end of the last fragment) to the peak
+        counted = carried['counted'] if carried is not None else None
+        first = counted + 1 if counted is not None else zero + 1
+        if carried is not None:
+            carried.update({'max': float(S[peak]), 'detected': detected, 'counted': int(index[peak])})
+
+        end = _format_time(timestamps.iloc[peak])
+        return {
+            'trouble_type': DRIFT,
+            'start': onset,
+            'end': end,
+            'duration': (pd.Timestamp(end) - pd.Timestamp(onset)).total_seconds(),
+            'peak': float(DIRECTIONS[direction] * S[peak]),
+            'sample_count': int(index[peak]) - first + 1,
+            'pressure': float(rows['Pressure'].iloc[peak]),
+            'temperature': float(rows['Temperature'].iloc[peak]),
+            'dv': float(rows['DV'].iloc[peak]),
+            'meter': meter,
+            'direction': direction,
+            'detected': detected
+        }
+
+
+def pelt(values, penalty=None, min_size=2):
+    """Indexes where the mean of values changes (PELT, squared-error cost)
+
+    penalty defaults to a BIC-style 2 log(n) times the noise variance,
+    estimated robustly from the first differences.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n < 2 * min_size:
+        return []
+    if penalty is None:
+        noise = np.median(np.abs(np.diff(values) - np.median(np.diff(values)))) * 1.4826 / np.sqrt(2)
+        penalty = 2 * np.log(n) * max(noise, 1e-12) ** 2
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    squares = np.concatenate(([0.0], np.cumsum(values * values)))
+
+    def cost(starts, end):
+        length = end - starts
+        total = sums[end] - sums[starts]
+        return squares[end] - squares[starts] - total * total / length
+
+    best = np.full(n + 1, np.inf)
+    best[0] = -penalty
+    previous = np.zeros(n + 1, dtype=np.int64)
+    candidates = np.array([0])
+    for end in range(min_size, n + 1):
+        totals = best[candidates] + cost(candidates, end)
+        i = np.argmin(totals)
+        best[end] = totals[i] + penalty
+        previous[end] = candidates[i]
+        # Prune candidates that can never be optimal again; the next one
+        # is the last start leaving min_size rows before end + 1
+        candidates = np.append(candidates[totals <= best[end]], end - min_size + 1)
+
+    changes = []
+    end = n
+    while end > 0:
+        end = int(previous[end])
+        if end > 0:
+            changes.append(end)
+    return changes[::-1]
+
+
+def offline_segments(df, params, block=PELT_BLOCK, penalty=None):
+    """Constant-mean segments of each meter's standardized residual
+
+    The residual is averaged over blocks of rows first, which also tames
+    its autocorrelation; segment means are in robust sigmas.
+    """
+    meters = (df[METER_COLUMN].astype(str).to_numpy() if METER_COLUMN in df
+              else np.full(len(df), None, dtype=object))
+    segments = []
+    for meter in pd.unique(meters):
+        rows = df[meters == meter]
+        z = standardize(rows['Residual'].to_numpy(), params, np.inf)
+        blocks = len(z) // block
+        if not blocks:
+            continue
+        means = z[:blocks * block].reshape(blocks, block).mean(axis=1)
+        bounds = [0, *pelt(means, penalty), blocks]
+        times = rows['Timestamp']
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            segments.append({
+                'meter': meter,
+                'start': _format_time(times.iloc[lo * block]),
+                'end': _format_time(times.iloc[hi * block - 1]),
+                'rows': (hi - lo) * block,
+                'mean': float(means[lo:hi].mean())
+            })
+    return segments
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'--batch': 1000, '--block': PELT_BLOCK, '--penalty': None}
+    offline = '--pelt' in args
+    if offline:
+        args.remove('--pelt')
+    for flag, default in options.items():
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = type(default)(args[i + 1]) if default is not None else float(args[i + 1])
+            del args[i:i + 2]
+    if len(args) != 1:
+        print(__doc__)
+        sys.exit(1)
+    from detection import classify_troubles, fit_model
+    from incidents import extend_incidents
+    from quantiles import QuantileSketch, robust_params
+    from schema import read_meter_csv
+
+    df, _, residual_std = fit_model(read_meter_csv(args[0]).dropna().reset_index(drop=True))
+    params = robust_params(QuantileSketch().update(df['Residual']))
+
+    if offline:
+        start = time.perf_counter()
+        segments = offline_segments(df, params, options['--block'], options['--penalty'])
+        print(f"{len(segments)} segments in {(time.perf_counter() - start) * 1000:.1f} ms "
+              f"(blocks of {options['--block']} rows, mean in robust sigmas)")
+        for segment in segments:
+            print(f"  {segment['meter']}  {segment['start']} .. {segment['end']}  "
+                  f"{segment['rows']:>7,} rows  mean {segment['mean']:+7.2f}")
+        sys.exit(0)
+
+    # The same batches the live pipeline would see
+    detector = CusumDetector()
+    incidents = []
+    cusum_time = rules_time = 0.0
+    for offset in range(0, len(df), options['--batch']):
+        batch = df.iloc[offset:offset + options['--batch']]
+        start = time.perf_counter()
+        classify_troubles(batch, residual_std, robust=params)
+        rules_time += time.perf_counter() - start
+        start = time.perf_counter()
+        extend_incidents(incidents, detector.update(batch, params))
+        cusum_time += time.perf_counter() - start
+
+    batches = -(-len(df) // options['--batch'])
+    print(f"{len(df):,} rows in {batches} batches: CUSUM {cusum_time / batches * 1000:.2f} ms/batch, "
+          f"threshold rules {rules_time / batches * 1000:.2f} ms/batch")
+    print(f"{len(incidents)} DRIFT incidents")
+    for incident in incidents:
+        print(f"  {incident['meter'] or '-'}  {incident['direction']:<4} onset {incident['start']}  detected {incident['detected']}  "
+              f"peak {incident['end']}  {incident['sample_count']:>6,} samples  S {incident['peak']:+9.1f}")
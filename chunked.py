@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+CHUNKED OUT-OF-CORE PROCESSING
+==============================
+
+Processes meter CSVs that do not fit in memory by reading them in
+fixed-size chunks. Peak memory is bounded by the chunk size, not the file.
+
+Without a pre-fitted model the file is read three times:
+    1. accumulate the normal equations (X'X, X'y, y'y) for the DV model,
+       which also give the residual standard deviation exactly;
+    2. apply the model and fill a quantile sketch with every residual;
+    3. apply the model chunk by chunk and run detection.
+With a pre-fitted model pass 1 is skipped.
+
+Detection only compares each row against residual limits and the fixed
+limits, so a row's result never depends on its neighbours and no overlap
+between chunks is needed. The residual std comes from pass 1 and is the
+same as in an in-memory run; the residual median and MAD come from the
+sketch of the whole file, so every chunk is classified with the same
+limits, within the sketch's rank error of an in-memory run. Incidents
+that straddle a chunk edge are merged with the open incident of the same
+type from the previous chunk.
+
+Usage:
+    python chunked.py data.csv [--chunksize N] [--out troubles.csv]
+"""
+
+import csv
+import resource
+import sys
+import time
+
+import numpy as np
+
+from detection import FEATURES, LinearModel, classify_troubles, detect_troubles
+from incidents import coalesce_troubles, extend_incidents, incident_key
+from quantiles import QuantileSketch, robust_params
+from schema import read_meter_csv
+
+# Rows per chunk; ~100k rows of four columns is a few MB
+CHUNK_SIZE = 100_000
+
+SIGNALS = ['DV', 'Pressure', 'Temperature']
+
+
+def iter_chunks(path, chunksize=CHUNK_SIZE):
+    """Yield cleaned chunks of the CSV"""
+    for chunk in read_meter_csv(path, chunksize=chunksize):
+        yield chunk.dropna()
+
+
+def fit_streaming(path, chunksize=CHUNK_SIZE):
+    """Fit the DV model in one streaming pass over the file"""
+    k = len(FEATURES) + 1
+    xtx = np.zeros((k, k))
+    xty = np.zeros(k)
+    yty = 0.0
+    n = 0
+
+    for chunk in iter_chunks(path, chunksize):
+        X = np.column_stack([np.ones(len(chunk)), chunk[FEATURES].to_numpy(dtype=float)])
+        y = chunk['DV'].to_numpy(dtype=float)
+        xtx += X.T @ X
+        xty += X.T @ y
+        yty += y @ y
+        n += len(chunk)
+
+    if n < 2:
+        raise ValueError(f"Not enough rows to fit a model in {path}")
+
+    beta = np.linalg.lstsq(xtx, xty, rcond=None)[0]
+
+    # Residual sum of squares from the same sums (residuals have zero mean
+    # because the model has an intercept)
+    rss = max(yty - 2 * beta @ xty + beta @ xtx @ beta, 0.0)
+    residual_std = np.sqrt(rss / (n - 1))
+
+    return LinearModel(beta[0], beta[1:], residual_std)
+
+
+class SignalStats:
+    """Running count, mean, min and max for each signal"""
+
+    def __init__(self, signals=SIGNALS):
+        self.count = 0
+        self.sums = dict.fromkeys(signals, 0.0)
+        self.mins = dict.fromkeys(signals, np.inf)
+        self.maxs = dict.fromkeys(signals, -np.inf)
+
+    def update(self, chunk):
+        self.count += len(chunk)
+        for signal in self.sums:
+            values = chunk[signal].to_numpy(dtype=float)
+            if len(values):
+                self.sums[signal] += values.sum()
+                self.mins[signal] = min(self.mins[signal], values.min())
+                self.maxs[signal] = max(self.maxs[signal], values.max())
+
+    def summary(self):
+        return {
+            signal: {
+                'mean': self.sums[signal] / self.count if self.count else 0.0,
+                'min': float(self.mins[signal]) if self.count else None,
+                'max': float(self.maxs[signal]) if self.count else None
+            }
+            for signal in self.sums
+        }
+
+
+def sketch_residuals(path, model, chunksize=CHUNK_SIZE):
+    """Quantile sketch of the model's residuals over the whole file"""
+    residuals = QuantileSketch()
+    for chunk in iter_chunks(path, chunksize):
+        model.apply(chunk)
+        residuals.update(chunk['Residual'].to_numpy())
+    return residuals
+
+
+def stream_detection(path, model, chunksize=CHUNK_SIZE, stats=None, residuals=None):
+    """Yield (chunk, trouble_types) for each chunk, updating stats along the way
+
+    residuals is the quantile sketch of the model's residuals over the
+    whole file; without it, it is built in an extra pass first.
+    """
+    if residuals is None:
+        residuals = sketch_residuals(path, model, chunksize)
+    robust = robust_params(residuals) if len(residuals) else None
+
+    # Rule hysteresis carries over from one chunk to the next
+    rule_state = {}
+    for chunk in iter_chunks(path, chunksize):
+        model.apply(chunk)
+        if stats is not None:
+            stats.update(chunk)
+        yield chunk, classify_troubles(chunk, model.residual_std, rule_state, robust)
+
+
+def stream_troubles(path, model, chunksize=CHUNK_SIZE, stats=None):
+    """Yield the troubles of each chunk, updating stats along the way"""
+    for chunk, trouble_types in stream_detection(path, model, chunksize, stats):
+        yield detect_troubles(chunk, trouble_types=trouble_types)
+
+
+def process_csv(path, model=None, chunksize=CHUNK_SIZE, on_troubles=None):
+    """Run the full pipeline over a CSV of any size and return a summary
+
+    on_troubles is called with each chunk's troubles so callers can write
+    them out instead of holding every trouble in memory.
+    """
+    if model is None:
+        model = fit_streaming(path, chunksize)
+
+    stats = SignalStats()
+    residuals = sketch_residuals(path, model, chunksize)
+    trouble_counts = {}
+    trouble_count = 0
+    incident_count = 0
+    open_incidents = []
+
+    for chunk, trouble_types in stream_detection(path, model, chunksize, stats, residuals):
+        hit_types, counts = np.unique(trouble_types[trouble_types != 'NORMAL'],
+                                      return_counts=True)
+        for trouble_type, count in zip(hit_types.tolist(), counts.tolist()):
+            trouble_counts[trouble_type] = trouble_counts.get(trouble_type, 0) + count
+        trouble_count += int(counts.sum())
+
+        # Only the latest incident of each type and meter can still grow
+        before = len(open_incidents)
+        extend_incidents(open_incidents, coalesce_troubles(chunk, trouble_types))
+        incident_count += len(open_incidents) - before
+        open_incidents = list({incident_key(i): i for i in open_incidents}.values())
+
+        if on_troubles is not None:
+            on_troubles(detect_troubles(chunk, trouble_types=trouble_types))
+
+    total_count = stats.count
+    return {
+        'total_count': total_count,
+        'trouble_count': trouble_count,
+        'incident_count': incident_count,
+        'trouble_rate': (trouble_count / total_count * 100) if total_count > 0 else 0,
+        'trouble_counts': trouble_counts,
+        'signals': stats.summary(),
+        'model': {
+            'intercept': model.intercept,
+            'coefficients': dict(zip(FEATURES, model.coefficients.tolist())),
+            'residual_std': model.residual_std,
+            **(robust_params(residuals) if len(residuals) else {})
+        }
+    }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    chunksize = CHUNK_SIZE
+    out_path = None
+    if '--chunksize' in args:
+        i = args.index('--chunksize')
+        chunksize = int(args[i + 1])
+        del args[i:i + 2]
+    if '--out' in args:
+        i = args.index('--out')
+        out_path = args[i + 1]
+        del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    writer = None
+    out_file = None
+    if out_path:
+        out_file = open(out_path, 'w', newline='')
+        writer = csv.DictWriter(out_file, fieldnames=[
+            'timestamp', 'pressure', 'temperature', 'dv', 'trouble_type'])
+        writer.writeheader()
+
+    start = time.perf_counter()
+    try:
+        summary = process_csv(args[0], chunksize=chunksize,
+                              on_troubles=writer.writerows if writer else None)
+    finally:
+        if out_file:
+            out_file.close()
+    elapsed = time.perf_counter() - start
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Rows: {summary['total_count']:,}  Troubles: {summary['trouble_count']:,} "
+          f"({summary['trouble_rate']:.2f}%)  Incidents: {summary['incident_count']:,}")
+    for trouble_type, count in sorted(summary['trouble_counts'].items()):
+        print(f"  {trouble_type:<18} {count:,}")
+    print(f"Processed in {elapsed:.2f}s, peak RSS {peak_mb:.0f} MB")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+LAGGED CROSS-CORRELATION
+========================
+
+Finds how strongly and with what delay DV follows Pressure and Temperature
+in pressure_to_dv_correlation.csv (or any file with the same columns).
+
+The readings arrive at an irregular ~17 ms spacing, so each signal is first
+interpolated onto a uniform grid. The cross-correlation at every lag is then
+computed at once with an FFT in O(n log n) instead of O(n * lags).
+
+A positive lag means DV follows the driving signal by that many seconds.
+Results are cached per file fingerprint (size and modification time).
+
+Usage:
+    python correlation.py [file.csv] [--max-lag SECONDS]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+from schema import read_meter_csv
+
+CORRELATION_FILE = 'pressure_to_dv_correlation.csv'
+
+# Largest lag searched, in seconds
+MAX_LAG_SECONDS = 30.0
+
+# Signal pairs analysed: (driver, response)
+PAIRS = [('Pressure', 'DV'), ('Temperature', 'DV')]
+
+_cache = {}
+
+
+def file_fingerprint(path):
+    """Cheap identity of a file's contents: size and modification time"""
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def resample_uniform(df, columns, step=None):
+    """Interpolate columns onto a uniform time grid
+
+    Returns (step_seconds, {column: values}). The default step is the
+    median sample spacing.
+    """
+    t = (df['Timestamp'] - df['Timestamp'].iloc[0]).dt.total_seconds().to_numpy()
+    if step is None:
+        step = float(np.median(np.diff(t)))
+    grid = np.arange(0.0, t[-1] + step / 2, step)
+    return step, {c: np.interp(grid, t, df[c].to_numpy(dtype=float)) for c in columns}
+
+
+def cross_correlation(x, y, max_lag):
+    """Normalized cross-correlation of x and y for lags -max_lag..max_lag
+
+    r[k] = sum_t x[t] * y[t + k] / (n * std(x) * std(y)) on mean-removed
+    signals, computed with one FFT per signal.
+    """
+    n = len(x)
+    x = x - x.mean()
+    y = y - y.mean()
+    scale = n * x.std() * y.std()
+    lags = np.arange(-max_lag, max_lag + 1)
+    if scale == 0:
+        return lags, np.zeros(len(lags))
+
+    nfft = 1 << (2 * n - 1).bit_length()
+    corr = np.fft.irfft(np.conj(np.fft.rfft(x, nfft)) * np.fft.rfft(y, nfft), nfft)
+    # Negative lags wrap around to the end of the circular result
+    return lags, corr[lags % nfft] / scale
+
+
+def analyze(df, max_lag_seconds=MAX_LAG_SECONDS, step=None):
+    """Best lag and coefficient for every signal pair"""
+    if not np.isfinite(max_lag_seconds) or max_lag_seconds < 0:
+        raise ValueError(f"max_lag must be a finite number of seconds >= 0, not {max_lag_seconds}")
+    # Repeated timestamps would give a zero grid step
+    df = df.dropna().sort_values('Timestamp').drop_duplicates('Timestamp')
+    if len(df) < 2:
+        raise ValueError('At least two distinct timestamps are needed')
+    columns = sorted({c for pair in PAIRS for c in pair})
+    step, signals = resample_uniform(df, columns, step)
+    n = len(signals['DV'])
+    max_lag = max(0, min(int(round(max_lag_seconds / step)), n - 1))
+
+    pairs = {}
+    for driver, response in PAIRS:
+        lags, corr = cross_correlation(signals[driver], signals[response], max_lag)
+        best = int(np.argmax(np.abs(corr)))
+        zero = int(np.flatnonzero(lags == 0)[0])
+        pairs[f"{driver}_to_{response}"] = {
+            'best_lag_samples': int(lags[best]),
+            'best_lag_seconds': float(lags[best] * step),
+            'coefficient': float(corr[best]),
+            'zero_lag_coefficient': float(corr[zero])
+        }
+
+    return {
+        'samples': len(df),
+        'grid_samples': n,
+        'step_seconds': step,
+        'max_lag_seconds': max_lag * step,
+        'start': df['Timestamp'].iloc[0].isoformat(),
+        'end': df['Timestamp'].iloc[-1].isoformat(),
+        'pairs': pairs
+    }
+
+
+def analyze_file(path=CORRELATION_FILE, max_lag_seconds=MAX_LAG_SECONDS):
+    """Analyze a file, reusing the cached result while the file is unchanged"""
+    key = (os.path.abspath(path), file_fingerprint(path), max_lag_seconds)
+    if key not in _cache:
+        df = read_meter_csv(path)
+        result = analyze(df, max_lag_seconds)
+        result['fingerprint'] = key[1]
+        # Keep only the latest result per file
+        for old in [k for k in _cache if k[0] == key[0]]:
+            del _cache[old]
+        _cache[key] = result
+    return _cache[key]
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    max_lag = MAX_LAG_SECONDS
+    if '--max-lag' in args:
+        i = args.index('--max-lag')
+        max_lag = float(args[i + 1])
+        del args[i:i + 2]
+    path = args[0] if args else CORRELATION_FILE
+
+    result = analyze_file(path, max_lag)
+    print(f"{result['samples']:,} samples resampled to {result['grid_samples']:,} "
+          f"at {result['step_seconds'] * 1000:.1f} ms")
+    for name, pair in result['pairs'].items():
+        print(f"  {name:<18} lag {pair['best_lag_seconds']:+.3f}s "
+              f"r={pair['coefficient']:+.3f} (r at lag 0: {pair['zero_lag_coefficient']:+.3f})")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+DATASET MANAGER
+===============
+
+Serves several meter CSVs from one server. Every registered file gets its
+own LivePipeline (model, troubles, incidents, aggregates, compressed
+history), created on first view and kept in an LRU cache. After each
+refresh the cached pipelines are measured from their actual frame and
+block sizes, and the least recently viewed ones are evicted until the
+cache fits the memory budget. Switching back to a cached dataset only
+parses the rows appended since it was last viewed.
+
+Datasets are registered by path and requested by file name
+(?dataset=pressure_to_dv_correlation.csv); names that were never
+registered are rejected, so a request cannot open arbitrary files.
+With a model directory, each dataset's pipeline follows its own model
+registry (<model_dir>/<name>/, see model_registry.py).
+
+Usage:
+    python datasets.py a.csv b.csv [--budget-mb 1024]   # load each, report sizes
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from model_registry import ModelRegistry, dataset_directory
+from tail_reader import LivePipeline
+
+# Comma-separated data files served with ?dataset=<file name>
+DATASETS = [path for path in os.environ.get(
+    'DATASETS', 'June18-21_data.csv,pressure_to_dv_correlation.csv').split(',') if path]
+
+# Memory the cached pipelines may use together
+MEMORY_BUDGET_MB = float(os.environ.get('DATASET_MEMORY_MB', 1024))
+
+
+class UnknownDataset(ValueError):
+    """Raised when a request names a dataset that was not registered"""
+
+
+class DatasetManager:
+    """Registered data files and an LRU cache of their pipelines"""
+
+    def __init__(self, paths=(), default=None, budget_mb=MEMORY_BUDGET_MB,
+                 model_dir=None, hot_rows=None):
+        self.paths = {}
+        self.default = None
+        self.budget = int(budget_mb * 2**20)
+        self.model_dir = model_dir
+        self.hot_rows = hot_rows
+        # name -> ModelRegistry, kept across pipeline evictions
+        self._registries = {}
+        # Least recently viewed first
+        self._pipelines = OrderedDict()
+        # name -> (pipeline, version, nbytes) as last measured
+        self._sizes = {}
+        self._lock = threading.Lock()
+        for path in paths:
+            self.register(path)
+        if default is not None:
+            self.register(default, default=True)
+
+    def register(self, path, name=None, default=False):
+        """Serve path as ?dataset=name (its file name by default)"""
+        name = name or os.path.basename(path)
+        with self._lock:
+            if self.paths.get(name, path) != path:
+                # Re-registered to another file: drop the old pipeline
+                self._pipelines.pop(name, None)
+                self._sizes.pop(name, None)
+            self.paths[name] = path
+            if default or self.default is None:
+                self.default = name
+        return name
+
+    def _registry(self, name):
+        if self.model_dir is None:
+            return None
+        if name not in self._registries:
+            self._registries[name] = ModelRegistry(dataset_directory(name, self.model_dir))
+        return self._registries[name]
+
+    def registry(self, name=None):
+        """Model registry of a registered dataset (None without a model directory)"""
+        name = name or self.default
+        with self._lock:
+            if name not in self.paths:
+                raise UnknownDataset(f"Unknown dataset: {name} (choose from {', '.join(self.paths)})")
+            return self._registry(name)
+
+    def names(self):
+        with self._lock:
+            return list(self.paths)
+
+    def get(self, name=None):
+        """Pipeline of a registered dataset (the default one without a name)"""
+        name = name or self.default
+        with self._lock:
+            if name not in self.paths:
+                raise UnknownDataset(f"Unknown dataset: {name} (choose from {', '.join(self.paths)})")
+            pipeline = self._pipelines.get(name)
+            if pipeline is None:
+                pipeline = LivePipeline(self.paths[name], self._registry(name), self.hot_rows)
+                self._pipelines[name] = pipeline
+            self._pipelines.move_to_end(name)
+            return pipeline
+
+    def is_default(self, pipeline):
+        with self._lock:
+            return self._pipelines.get(self.default) is pipeline
+
+    def _measure(self):
+        """{name: nbytes} of the cached pipelines, remeasured when they changed"""
+        with self._lock:
+            cached = list(self._pipelines.items())
+        sizes = {}
+        for name, pipeline in cached:
+            measured = self._sizes.get(name)
+            if measured is None or measured[0] is not pipeline or measured[1] != pipeline.version:
+                measured = (pipeline, pipeline.version, pipeline.nbytes())
+                self._sizes[name] = measured
+            sizes[name] = measured[2]
+        return sizes
+
+    def fit_budget(self, keep=None):
+        """Evict least recently viewed pipelines (never keep) until the cache fits the budget"""
+        sizes = self._measure()
+        evicted = []
+        with self._lock:
+            total = sum(sizes.get(name, 0) for name in self._pipelines)
+            for name in list(self._pipelines):
+                if total <= self.budget:
+                    break
+                if self._pipelines[name] is keep:
+                    continue
+                total -= sizes.get(name, 0)
+                del self._pipelines[name]
+                self._sizes.pop(name, None)
+                evicted.append(name)
+        return evicted
+
+    def info(self):
+        """Registered datasets with their cache state and measured size"""
+        sizes = self._measure()
+        with self._lock:
+            recent = list(self._pipelines)[::-1]
+            return {
+                'default': self.default,
+                'budget_bytes': self.budget,
+                'cached_bytes': sum(sizes.get(name, 0) for name in recent),
+                'datasets': [{
+                    'name': name,
+                    'path': path,
+                    'cached': name in self._pipelines,
+                    'recency': recent.index(name) if name in self._pipelines else None,
+                    'rows': self._pipelines[name].total_count if name in self._pipelines else None,
+                    'bytes': sizes.get(name)
+                } for name, path in self.paths.items()]
+            }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    budget = MEMORY_BUDGET_MB
+    if '--budget-mb' in args:
+        i = args.index('--budget-mb')
+        budget = float(args[i + 1])
+        del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    manager = DatasetManager(args, budget_mb=budget)
+    for name in manager.names() + manager.names():
+        start = time.perf_counter()
+        pipeline = manager.get(name)
+        pipeline.refresh()
+        evicted = manager.fit_budget(keep=pipeline)
+        print(f"{name:<36} {pipeline.total_count:>10,} rows  "
+              f"{(time.perf_counter() - start) * 1000:8.1f} ms"
+              + (f"  evicted {', '.join(evicted)}" if evicted else ''))
+    info = manager.info()
+    print(f"cached {info['cached_bytes'] / 2**20:.1f} of {info['budget_bytes'] / 2**20:.0f} MB")
+    for dataset in info['datasets']:
+        size = f"{dataset['bytes'] / 2**20:8.1f} MB" if dataset['bytes'] is not None else f"{'-':>8}"
+        print(f"  {dataset['name']:<36} {size}  {'cached' if dataset['cached'] else ''}")
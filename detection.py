@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+TROUBLE DETECTION
+=================
+
+DV model fitting and trouble detection shared by the dashboard apps.
+
+The model predicts DV from Pressure and Temperature with a linear
+regression; rows whose residual or raw readings break one of the alert
+rules (rules.json, see rules.py) are reported as troubles.
+"""
+
+import numpy as np
+from sklearn.linear_model import LinearRegression
+
+from quantiles import QuantileSketch, robust_params
+from rules import active_rules
+
+# Model inputs
+FEATURES = ['Pressure', 'Temperature']
+
+# Severity of trouble types reported by detectors rather than threshold rules
+DETECTOR_SEVERITIES = {'DRIFT': 'MEDIUM'}
+
+
+def fit_model(df):
+    """Fit the DV model and add DV_predicted / Residual columns to df"""
+    # Fit in float64 even when the frame stores float32
+    X = df[FEATURES].astype('float64')
+    y = df['DV'].astype('float64')
+
+    model = LinearRegression()
+    model.fit(X, y)
+
+    # Calculate residuals
+    df['DV_predicted'] = model.predict(X)
+    df['Residual'] = df['DV'] - df['DV_predicted']
+    residual_std = df['Residual'].std()
+
+    return df, model, residual_std
+
+
+class LinearModel:
+    """Fitted DV model that can be applied to any frame with the features"""
+
+    def __init__(self, intercept, coefficients, residual_std, residual_mean=0.0):
+        self.intercept = float(intercept)
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.residual_std = float(residual_std)
+        self.residual_mean = float(residual_mean)
+
+    @classmethod
+    def from_estimator(cls, model, residual_std, residual_mean=0.0):
+        """Wrap a fitted sklearn regressor"""
+        return cls(model.intercept_, model.coef_, residual_std, residual_mean)
+
+    def predict(self, df):
+        """Predict DV for every row of df"""
+        X = df[FEATURES].to_numpy(dtype=float)
+        return X @ self.coefficients + self.intercept
+
+    def apply(self, df):
+        """Add DV_predicted / Residual columns to df"""
+        df['DV_predicted'] = self.predict(df)
+        df['Residual'] = df['DV'] - df['DV_predicted']
+        return df
+
+    def to_dict(self):
+        return {
+            'features': FEATURES,
+            'intercept': self.intercept,
+            'coefficients': self.coefficients.tolist(),
+            'residual_std': self.residual_std,
+            'residual_mean': self.residual_mean
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('features', FEATURES) != FEATURES:
+            raise ValueError(f"Model features {data['features']} do not match {FEATURES}")
+        return cls(data['intercept'], data['coefficients'],
+                   data['residual_std'], data.get('residual_mean', 0.0))
+
+
+def classify_troubles(df, residual_std=None, state=None, robust=None):
+    """Return the trouble type of every row ('NORMAL' when there is none)
+
+    Without residual_std (no model) the residual rules are skipped. Pass the
+    same state dict for consecutive batches of one stream so hysteresis
+    carries over between them. robust holds residual_median / residual_mad
+    (see quantiles.py); streams pass them from a sketch kept across
+    batches, otherwise they are estimated from df's own residuals.
+    """
+    params = {'residual_std': residual_std}
+    if robust is None and 'Residual' in df:
+        robust = robust_params(QuantileSketch().update(df['Residual']))
+    params.update(robust or {})
+    return active_rules().classify(df, params, state)
+
+
+def trouble_severity(trouble_type):
+    """Severity of a trouble type under the current rules"""
+    return active_rules().severities.get(trouble_type, DETECTOR_SEVERITIES.get(trouble_type, 'LOW'))
+
+
+def config_fingerprint():
+    """Short hash of the detection configuration"""
+    return active_rules().fingerprint
+
+
+def detect_troubles(df, residual_std=None, trouble_types=None):
+    """Detect troubles in the data (or list them from precomputed trouble_types)"""
+    if trouble_types is None:
+        trouble_types = classify_troubles(df, residual_std)
+    hits = df[trouble_types != 'NORMAL']
+
+    timestamps = hits['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return [
+        {
+            'timestamp': timestamp,
+            'pressure': pressure,
+            'temperature': temperature,
+            'dv': dv,
+            'trouble_type': trouble_type
+        }
+        for timestamp, pressure, temperature, dv, trouble_type in zip(
+            timestamps.tolist(),
+            hits['Pressure'].tolist(),
+            hits['Temperature'].tolist(),
+            hits['DV'].tolist(),
+            trouble_types[trouble_types != 'NORMAL'].tolist())
+    ]
+
+
+def status_for(trouble_count):
+    """Map a trouble count to the dashboard status"""
+    if trouble_count == 0:
+        return "NORMAL"
+    elif trouble_count <= 50:
+        return "ATTENTION"
+    return "TROUBLE"
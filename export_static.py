@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+STATIC DASHBOARD EXPORT
+=======================
+
+Runs the full pipeline once and writes a self-contained static dashboard:
+
+    dashboard.json   dashboard data (the /api/dashboard-data payload)
+    dashboard.webp   dashboard rendered for screens
+    dashboard.png    high resolution print rendering
+    dashboard.svg    vector version of the same figure
+    index.html       dashboard page reading dashboard.json
+
+The output directory can be served from any CDN or static host, so
+historical datasets need no Python function invocations at all. Keep the
+Flask app only for live data.
+
+Usage:
+    python export_static.py [--data June18-21_data.csv] [--out public]
+"""
+
+import json
+import os
+import sys
+
+import app as dashboard
+from render import RENDER_PROFILES
+
+OUTPUT_DIR = 'public'
+
+# Render profiles written next to dashboard.json
+EXPORT_PROFILES = ['screen', 'print', 'vector']
+
+
+def export(out_dir=OUTPUT_DIR):
+    """Write the static dashboard into out_dir and return the written paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    data = dict(dashboard.build_dashboard_data())
+    for key in ('plot_url', 'plot_mime', 'render_profile'):
+        del data[key]
+
+    images = {
+        f"dashboard.{RENDER_PROFILES[profile]['format']}": dashboard.render_dashboard_image(profile)
+        for profile in EXPORT_PROFILES
+    }
+    data['plot_src'] = f"dashboard.{RENDER_PROFILES['screen']['format']}"
+
+    written = []
+    for name, content in images.items():
+        path = os.path.join(out_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        written.append(path)
+
+    path = os.path.join(out_dir, 'dashboard.json')
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    written.append(path)
+
+    with dashboard.app.test_request_context():
+        html = dashboard.render_template('dashboard.html', data_url='dashboard.json')
+    path = os.path.join(out_dir, 'index.html')
+    with open(path, 'w') as f:
+        f.write(html)
+    written.append(path)
+
+    return written
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    out_dir = OUTPUT_DIR
+    if '--out' in args:
+        i = args.index('--out')
+        out_dir = args[i + 1]
+        del args[i:i + 2]
+    if '--data' in args:
+        i = args.index('--data')
+        dashboard.datasets.register(args[i + 1], default=True)
+        del args[i:i + 2]
+
+    for path in export(out_dir):
+        print(f"Wrote {path} ({os.path.getsize(path):,} bytes)")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+FIGURE LIFECYCLE
+================
+
+pyplot keeps every figure in a global registry until plt.close() is
+called. A render that raises after plt.subplots() therefore leaks a whole
+figure, and a long-running worker grows until it is killed.
+
+managed_figure() and @releases_figures close the figures they create on
+every exit path. Both hold PYPLOT_LOCK, because pyplot's registry is
+shared by all request threads. Panels drawn on standalone Figure objects
+(panels.py) do not need either.
+
+memory_report() gives the live figure count, RSS and, when tracemalloc is
+tracing (e.g. PYTHONTRACEMALLOC=1), the top allocating source lines.
+"""
+
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from schema import resident_memory
+
+# Serializes use of pyplot's global figure registry across request threads
+PYPLOT_LOCK = threading.RLock()
+
+# Allocation sites listed by memory_report()
+TOP_ALLOCATIONS = 10
+
+
+@contextmanager
+def managed_figure(*args, **kwargs):
+    """plt.subplots() whose figure is closed however the block exits"""
+    with PYPLOT_LOCK:
+        fig, axes = plt.subplots(*args, **kwargs)
+        try:
+            yield fig, axes
+        finally:
+            plt.close(fig)
+
+
+def releases_figures(func):
+    """Decorator: close every pyplot figure the call opened, on any exit path"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with PYPLOT_LOCK:
+            before = set(plt.get_fignums())
+            try:
+                return func(*args, **kwargs)
+            finally:
+                for num in set(plt.get_fignums()) - before:
+                    plt.close(num)
+    return wrapper
+
+
+def open_figures():
+    """Number of figures held by pyplot"""
+    return len(plt.get_fignums())
+
+
+def allocation_snapshot():
+    """tracemalloc snapshot without tracemalloc's and the import system's own allocations"""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+
+
+def memory_report(limit=TOP_ALLOCATIONS):
+    """Live figures, RSS and (if tracing) the top tracemalloc allocation sites"""
+    report = {
+        'open_figures': open_figures(),
+        'rss_mb': round(resident_memory() / 2**20, 1),
+        'tracemalloc': {'tracing': tracemalloc.is_tracing()}
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        stats = allocation_snapshot().statistics('lineno')
+        report['tracemalloc'].update({
+            'traced_mb': round(current / 2**20, 2),
+            'peak_mb': round(peak / 2**20, 2),
+            'top': [{
+                'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_kb': round(stat.size / 1024, 1),
+                'count': stat.count
+            } for stat in stats[:limit]]
+        })
+    return report
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+INCIDENT COALESCING
+===================
+
+Merges consecutive per-sample troubles of the same type into incidents.
+A 30 s pressure excursion at 60 Hz is ~1,800 troubles but one incident
+with a start, end, duration, peak value and sample count.
+
+Hits of the same type (and meter, for files with a MeterID column) belong
+to the same incident while the time between them is at most the gap
+tolerance. Grouping is done with vectorized
+run-length encoding, so the cost is a sort over the hits, not a Python
+loop over rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+from detection import classify_troubles
+from rules import active_rules
+from schema import METER_COLUMN
+
+# Largest gap between two hits of one type that still counts as one incident
+GAP_TOLERANCE = pd.Timedelta(seconds=1)
+
+# Millisecond precision so batches can be merged exactly
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def peak_rules():
+    """Signal that defines the peak of each trouble type and how to rank it
+
+    'max' keeps the highest value, 'min' the lowest, 'abs' the largest
+    magnitude; derived from the alert rules.
+    """
+    return active_rules().peak_rules
+
+
+def _peak_key(values, how):
+    """Rank values so that the peak has the largest key"""
+    if how == 'min':
+        return -values
+    if how == 'abs':
+        return np.abs(values)
+    return values
+
+
+def _format_times(times):
+    """Format a DatetimeIndex to millisecond strings"""
+    return [text[:-3] for text in times.strftime(TIME_FORMAT)]
+
+
+def coalesce_troubles(df, trouble_types, gap_tolerance=GAP_TOLERANCE):
+    """Merge per-row trouble types into a list of incidents sorted by start"""
+    trouble_types = np.asarray(trouble_types)
+    hit = trouble_types != 'NORMAL'
+    if not hit.any():
+        return []
+
+    hits = df.loc[hit]
+    types = trouble_types[hit]
+    times = hits['Timestamp'].to_numpy()
+
+    # Peak ranking key and value for every hit
+    peak_values = np.empty(len(hits))
+    peak_keys = np.empty(len(hits))
+    for trouble_type, (signal, how) in peak_rules().items():
+        mask = types == trouble_type
+        if mask.any():
+            values = hits[signal].to_numpy(dtype=float)[mask]
+            peak_values[mask] = values
+            peak_keys[mask] = _peak_key(values, how)
+
+    # Meter of every hit (None without a meter column)
+    if METER_COLUMN in hits:
+        meter_codes, meter_names = pd.factorize(hits[METER_COLUMN].astype(str))
+        meter_names = np.asarray(meter_names, dtype=object)
+    else:
+        meter_codes, meter_names = np.zeros(len(hits), dtype=np.int64), np.array([None])
+
+    # Sort by meter, type then time; a run breaks on a meter or type change or a large gap
+    order = np.lexsort((times, types, meter_codes))
+    types = types[order]
+    times = times[order]
+    meter_codes = meter_codes[order]
+    gaps = np.diff(times) > np.timedelta64(gap_tolerance.value, 'ns')
+    breaks = np.concatenate(([True], (types[1:] != types[:-1]) |
+                             (meter_codes[1:] != meter_codes[:-1]) | gaps))
+    starts = np.flatnonzero(breaks)
+    ends = np.concatenate((starts[1:], [len(types)])) - 1
+    run_ids = np.cumsum(breaks) - 1
+
+    # Peak of each run: highest key within the run
+    peak_order = np.lexsort((-peak_keys[order], run_ids))
+    peak_pos = order[peak_order[starts]]
+
+    start_times = pd.DatetimeIndex(times[starts])
+    end_times = pd.DatetimeIndex(times[ends])
+    durations = (end_times - start_times).total_seconds()
+
+    pressure = hits['Pressure'].to_numpy()[peak_pos]
+    temperature = hits['Temperature'].to_numpy()[peak_pos]
+    dv = hits['DV'].to_numpy()[peak_pos]
+
+    incidents = [
+        {
+            'trouble_type': trouble_type,
+            'start': start,
+            'end': end,
+            'duration': duration,
+            'peak': peak,
+            'sample_count': sample_count,
+            'pressure': p,
+            'temperature': t,
+            'dv': d,
+            'meter': meter
+        }
+        for trouble_type, start, end, duration, peak, sample_count, p, t, d, meter in zip(
+            types[starts].tolist(), _format_times(start_times), _format_times(end_times),
+            durations.tolist(),
+            peak_values[peak_pos].tolist(), (ends - starts + 1).tolist(),
+            pressure.tolist(), temperature.tolist(), dv.tolist(),
+            meter_names[meter_codes[starts]].tolist())
+    ]
+    incidents.sort(key=lambda incident: incident['start'])
+    return incidents
+
+
+def detect_incidents(df, residual_std, gap_tolerance=GAP_TOLERANCE):
+    """Detect troubles and coalesce them into incidents"""
+    return coalesce_troubles(df, classify_troubles(df, residual_std), gap_tolerance)
+
+
+def incident_key(incident):
+    """What an incident can merge with: its type, meter and (DRIFT) direction"""
+    return incident['trouble_type'], incident.get('meter'), incident.get('direction')
+
+
+def extend_incidents(incidents, new_incidents, gap_tolerance=GAP_TOLERANCE):
+    """Append incidents from a later batch, merging runs split by the batch edge
+
+    Incidents only merge with incidents of the same type, meter and
+    direction.
+    """
+    last_by_type = {}
+    for incident in incidents:
+        last_by_type[incident_key(incident)] = incident
+
+    for incident in new_incidents:
+        key = incident_key(incident)
+        last = last_by_type.get(key)
+        if last is not None and (pd.Timestamp(incident['start']) -
+                                 pd.Timestamp(last['end'])) <= gap_tolerance:
+            how = peak_rules().get(incident['trouble_type'], (None, 'abs'))[1]
+            if _peak_key(incident['peak'], how) > _peak_key(last['peak'], how):
+                for field in ('peak', 'pressure', 'temperature', 'dv'):
+                    last[field] = incident[field]
+            last['end'] = incident['end']
+            last['duration'] = (pd.Timestamp(last['end']) -
+                                pd.Timestamp(last['start'])).total_seconds()
+            last['sample_count'] += incident['sample_count']
+        else:
+            incidents.append(incident)
+            last_by_type[key] = incident
+
+    return incidents
+
+
+def describe_incident(incident):
+    """One-line human readable description used by the alert panels"""
+    trouble_type = incident['trouble_type']
+    peak = incident['peak']
+    if trouble_type == 'HIGH_ANOMALY':
+        text = f"DV anomaly (residual {peak:.1f})"
+    elif trouble_type == 'LOW_PRESSURE':
+        text = f"Low pressure: {peak:.2f}"
+    elif trouble_type == 'HIGH_PRESSURE':
+        text = f"High pressure: {peak:.2f}"
+    elif trouble_type == 'LOW_TEMPERATURE':
+        text = f"Low temperature: {peak:.1f}°C"
+    elif trouble_type == 'HIGH_TEMPERATURE':
+        text = f"High temperature: {peak:.1f}°C"
+    elif trouble_type == 'EXTREME_DV':
+        text = f"Extreme DV value: {peak:.1f}"
+    elif trouble_type == 'DRIFT':
+        text = (f"Residual drifting {incident['direction']}"
+                + (f" on {incident['meter']}" if incident.get('meter') else '')
+                + f" (CUSUM {abs(peak):.0f})")
+    else:
+        text = trouble_type
+    return f"{text} for {incident['duration']:.1f}s ({incident['sample_count']} samples)"
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+DASHBOARD LOAD TEST
+===================
+
+Starts a dashboard app on a local port and simulates browsers viewing it:
+
+- every client loads the dashboard like dashboard.html does (data, then
+  the panel images) and then polls on the page's cadence, sending its
+  cursor (?since=) and ETag (If-None-Match) where the app supports them
+- every --burst-every seconds, --burst extra clients do a cold reload at
+  the same moment (no cursor, no ETag)
+
+It reports throughput, p50/p95/p99 latency and error rate per endpoint,
+and samples the resident memory of the server (and its child processes)
+and of the load generator every second.
+
+Usage:
+    python loadtest.py [app.py] [--clients 20] [--duration 60] [--interval 30]
+                       [--burst 10] [--burst-every 15] [--port 5055]
+                       [--url http://host:port] [--json results.json]
+
+With --url the load is sent to an already running server and no app is
+started (memory is then only sampled for the load generator).
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+# dashboard.html polls every 30 seconds
+POLL_INTERVAL = 30.0
+
+DATA_PATH = '/api/dashboard-data'
+
+# Runs the app's Flask object without its __main__ block (which may enable
+# debug mode or bind a fixed port)
+SERVER_CODE = """
+import logging, os, runpy, sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[1])))
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+namespace = runpy.run_path(sys.argv[1])
+namespace['app'].run(host='127.0.0.1', port=int(sys.argv[2]), debug=False,
+                     threaded=True, use_reloader=False)
+"""
+
+
+def rss_kb(pid):
+    """Resident memory of a process in kB (0 if it is gone)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def child_pids(pid):
+    """Direct children of a process (e.g. fleet detection workers)"""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+class Recorder:
+    """Thread-safe list of (endpoint, start, latency, status) samples"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, start, latency, status):
+        with self._lock:
+            self.samples.append((endpoint, start, latency, status))
+
+
+class DashboardClient:
+    """One simulated browser"""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.etag = None
+        self.cursor = None
+        self.panel_urls = {}
+
+    def get(self, endpoint, path, headers=None):
+        """GET path; returns (status, body) and records the latency"""
+        request = urllib.request.Request(self.base_url + path, headers=headers or {})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                status, body, etag = response.status, response.read(), response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            status, body, etag = e.code, e.read(), e.headers.get('ETag')
+        except (urllib.error.URLError, OSError):
+            status, body, etag = 0, b'', None
+        self.recorder.add(endpoint, start, time.perf_counter() - start, status)
+        if endpoint == 'data' and status == 200:
+            self.etag = etag
+        return status, body
+
+    def load(self, cold=False):
+        """Full page load: dashboard data, then any panel images that changed"""
+        headers = {} if cold or not self.etag else {'If-None-Match': self.etag}
+        status, body = self.get('data', DATA_PATH + '?layout=panels', headers)
+        if status != 200:
+            return
+        data = json.loads(body)
+        self.cursor = data.get('cursor')
+        for panel in data.get('panels', []):
+            if cold or self.panel_urls.get(panel['name']) != panel['url']:
+                self.get('panel', panel['url'])
+                self.panel_urls[panel['name']] = panel['url']
+
+    def poll(self):
+        """One refresh tick of dashboard.html"""
+        if not self.cursor:
+            self.load()
+            return
+        status, body = self.get('delta', f"{DATA_PATH}?since={urllib.parse.quote(self.cursor)}")
+        if status != 200:
+            return
+        data = json.loads(body)
+        if not data.get('delta'):
+            self.cursor = data.get('cursor')
+        else:
+            self.cursor = data['cursor']
+            if data['readings']['count'] > 0:
+                self.load()
+
+    def run(self, stop, interval, offset):
+        # Spread clients over the interval like independently opened tabs
+        if stop.wait(offset):
+            return
+        self.load(cold=True)
+        while not stop.wait(interval):
+            self.poll()
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {'p50': None, 'p95': None, 'p99': None}
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+
+def summarize(samples, elapsed):
+    """Per-endpoint and overall request statistics"""
+    summary = {}
+    for endpoint in ['all'] + sorted({s[0] for s in samples}):
+        rows = [s for s in samples if endpoint == 'all' or s[0] == endpoint]
+        errors = sum(1 for s in rows if s[3] == 0 or s[3] >= 400)
+        summary[endpoint] = {
+            'requests': len(rows),
+            'throughput': len(rows) / elapsed if elapsed > 0 else 0.0,
+            'error_rate': errors / len(rows) if rows else 0.0,
+            **percentiles([s[2] for s in rows])
+        }
+    return summary
+
+
+def wait_until_ready(base_url, server, timeout=120):
+    """Wait for the server to answer, failing early if it exits"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + '/', timeout=5):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s")
+
+
+def run(app_path='app.py', clients=20, duration=60.0, interval=POLL_INTERVAL,
+        burst=10, burst_every=15.0, port=5055, url=None):
+    """Run one load test and return its results"""
+    server = None
+    if url is None:
+        url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen([sys.executable, '-c', SERVER_CODE, app_path, str(port)],
+                                  stdout=subprocess.DEVNULL)
+    try:
+        wait_until_ready(url, server)
+        recorder = Recorder()
+        stop = threading.Event()
+        memory = []
+
+        def sample_memory():
+            start = time.perf_counter()
+            while True:
+                row = {'t': round(time.perf_counter() - start, 1),
+                       'loadtest_kb': rss_kb(os.getpid())}
+                if server is not None:
+                    row['server_kb'] = rss_kb(server.pid)
+                    row['children_kb'] = sum(rss_kb(pid) for pid in child_pids(server.pid))
+                memory.append(row)
+                if stop.wait(1.0):
+                    return
+
+        def bursts():
+            while not stop.wait(burst_every):
+                reloads = [threading.Thread(target=DashboardClient(url, recorder).load,
+                                            kwargs={'cold': True}, daemon=True)
+                           for _ in range(burst)]
+                for thread in reloads:
+                    thread.start()
+
+        threads = [threading.Thread(target=sample_memory, daemon=True)]
+        if burst > 0:
+            threads.append(threading.Thread(target=bursts, daemon=True))
+        for i in range(clients):
+            client = DashboardClient(url, recorder)
+            threads.append(threading.Thread(target=client.run, daemon=True,
+                                            args=(stop, interval, interval * i / clients)))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        elapsed = time.perf_counter() - start
+
+        return {
+            'app': app_path if server is not None else url,
+            'clients': clients,
+            'duration': elapsed,
+            'interval': interval,
+            'burst': burst,
+            'burst_every': burst_every,
+            'summary': summarize(list(recorder.samples), elapsed),
+            'memory': memory
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def print_report(result):
+    print(f"{result['app']}: {result['clients']} clients polling every {result['interval']:g}s, "
+          f"bursts of {result['burst']} every {result['burst_every']:g}s, {result['duration']:.0f}s")
+    print(f"{'endpoint':<10} {'requests':>9} {'req/s':>8} {'errors':>7} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, stats in result['summary'].items():
+        p = [f"{stats[k]:9.1f}" if stats[k] is not None else f"{'-':>9}" for k in ('p50', 'p95', 'p99')]
+        print(f"{endpoint:<10} {stats['requests']:>9,} {stats['throughput']:>8.1f} "
+              f"{stats['error_rate']:>6.1%} {' '.join(p)}")
+
+    print("\nResident memory (MB)")
+    step = max(1, len(result['memory']) // 10)
+    for row in result['memory'][::step] + result['memory'][-1:]:
+        parts = [f"t={row['t']:>6.1f}s"]
+        if 'server_kb' in row:
+            parts.append(f"server {row['server_kb'] / 1024:7.1f}")
+            parts.append(f"children {row['children_kb'] / 1024:7.1f}")
+        parts.append(f"loadtest {row['loadtest_kb'] / 1024:7.1f}")
+        print('  ' + '  '.join(parts))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'--clients': 20, '--duration': 60.0, '--interval': POLL_INTERVAL,
+               '--burst': 10, '--burst-every': 15.0, '--port': 5055,
+               '--url': None, '--json': None}
+    for flag, default in options.items():
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = type(default)(args[i + 1]) if default is not None else args[i + 1]
+            del args[i:i + 2]
+
+    result = run(args[0] if args else 'app.py',
+                 clients=options['--clients'], duration=options['--duration'],
+                 interval=options['--interval'], burst=options['--burst'],
+                 burst_every=options['--burst-every'], port=options['--port'],
+                 url=options['--url'])
+    print_report(result)
+    if options['--json']:
+        with open(options['--json'], 'w') as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+PANDAS-FREE METER READER
+========================
+
+Reads the fixed four-column meter schema (Timestamp, Pressure, Temperature,
+DV) into plain NumPy arrays and runs the alert rules on them, for the
+lightweight app (app-simple.py). Importing this module pulls in neither
+pandas nor scikit-learn, which keeps the cold start, memory footprint and
+deployment bundle of the simple variant small.
+
+Rows with a missing or unparseable value are dropped, like df.dropna() on
+the pandas path, and detect_troubles() returns the same records as
+detection.detect_troubles() without a model.
+
+Usage:
+    python meter_arrays.py data.csv    # parse time and trouble count
+"""
+
+import csv
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from rules import active_rules
+
+TIMESTAMP = 'Timestamp'
+SIGNALS = ['Pressure', 'Temperature', 'DV']
+
+
+def _read_fast(path, indexes):
+    """Parse with np.loadtxt; raises ValueError on empty or bad numeric fields"""
+    with open(path) as f:
+        f.readline()
+        values = np.loadtxt(f, delimiter=',', usecols=indexes[1:], dtype=np.float32, ndmin=2)
+    with open(path) as f:
+        f.readline()
+        timestamps = np.loadtxt(f, delimiter=',', usecols=indexes[0], dtype=str, ndmin=1)
+    return timestamps, values.T
+
+
+def _read_rows(path, indexes):
+    """Row-by-row parse that skips rows with missing or unparseable values"""
+    timestamps = []
+    values = [array('f') for _ in SIGNALS]
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            try:
+                timestamp = row[indexes[0]]
+                parsed = [float(row[i]) for i in indexes[1:]]
+            except (ValueError, IndexError):
+                continue
+            timestamps.append(timestamp)
+            for column, value in zip(values, parsed):
+                column.append(value)
+    return np.array(timestamps, dtype=str), [np.frombuffer(column, dtype=np.float32)
+                                             for column in values]
+
+
+def read_meter_arrays(path):
+    """Read a meter CSV into {column: array}, dropping incomplete rows"""
+    with open(path, newline='') as f:
+        header = next(csv.reader(f), [])
+    missing = [c for c in (TIMESTAMP, *SIGNALS) if c not in header]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    indexes = [header.index(c) for c in (TIMESTAMP, *SIGNALS)]
+
+    try:
+        timestamps, values = _read_fast(path, indexes)
+    except ValueError:
+        timestamps, values = _read_rows(path, indexes)
+
+    # Same rows as dropna(): every value present and not NaN
+    keep = timestamps != ''
+    for column in values:
+        keep &= ~np.isnan(column)
+    columns = {TIMESTAMP: timestamps[keep]}
+    columns.update({signal: column[keep] for signal, column in zip(SIGNALS, values)})
+    return columns
+
+
+def detect_troubles(columns, rules=None):
+    """Trouble records for rows breaking a threshold rule (residual rules are skipped)"""
+    rules = rules or active_rules()
+    trouble_types = rules.classify(columns)
+    hits = trouble_types != 'NORMAL'
+
+    # Second resolution, as strftime('%Y-%m-%d %H:%M:%S') gives on the pandas path
+    timestamps = [t[:19].replace('T', ' ') for t in columns[TIMESTAMP][hits].tolist()]
+    return [
+        {
+            'timestamp': timestamp,
+            'pressure': pressure,
+            'temperature': temperature,
+            'dv': dv,
+            'trouble_type': trouble_type
+        }
+        for timestamp, pressure, temperature, dv, trouble_type in zip(
+            timestamps,
+            columns['Pressure'][hits].tolist(),
+            columns['Temperature'][hits].tolist(),
+            columns['DV'][hits].tolist(),
+            trouble_types[hits].tolist())
+    ]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    start = time.perf_counter()
+    columns = read_meter_arrays(sys.argv[1])
+    parsed = time.perf_counter()
+    troubles = detect_troubles(columns)
+    done = time.perf_counter()
+    print(f"{len(columns[TIMESTAMP]):,} rows parsed in {parsed - start:.3f}s, "
+          f"{len(troubles):,} troubles detected in {done - parsed:.3f}s")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+MULTI-METER FLEET DETECTION
+===========================
+
+Partitions meter data by meter id, fits a separate DV model and residual
+statistics per meter and runs detection for every meter on a process pool:
+the threshold rules and the drift CUSUM (changepoint.py), both with the
+residual median and MAD of that meter's fit. Per-meter results are merged
+into a fleet summary.
+
+Usage:
+    python meters.py [data.csv] [--workers N]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from changepoint import CusumDetector
+from detection import classify_troubles, fit_model, status_for
+from incidents import coalesce_troubles
+from quantiles import QuantileSketch, robust_params
+from schema import DEFAULT_METER, METER_COLUMN, read_meter_csv
+
+DATA_FILE = os.environ.get('DATA_FILE', 'June18-21_data.csv')
+
+
+def fleet_frame(df):
+    """Readings with a string meter id column (DEFAULT_METER when the file has none)"""
+    df = df.copy()
+    if METER_COLUMN not in df.columns:
+        df[METER_COLUMN] = DEFAULT_METER
+    df[METER_COLUMN] = df[METER_COLUMN].astype(str)
+    return df.dropna()
+
+
+def load_fleet_data(path=DATA_FILE):
+    """Load readings for every meter in the file"""
+    return fleet_frame(read_meter_csv(path))
+
+
+def partition_by_meter(df):
+    """Split the readings into one frame per meter id"""
+    return {
+        str(meter_id): meter_df.reset_index(drop=True)
+        for meter_id, meter_df in df.groupby(METER_COLUMN, sort=True)
+    }
+
+
+def process_meter(meter_id, df):
+    """Fit the model for one meter and detect its troubles and drift"""
+    df, model, residual_std = fit_model(df)
+    robust = robust_params(QuantileSketch().update(df['Residual']))
+    trouble_types = classify_troubles(df, residual_std, robust=robust)
+    drift = CusumDetector().update(df, {'residual_std': residual_std, **robust})
+    incidents = sorted(coalesce_troubles(df, trouble_types) + drift,
+                       key=lambda incident: incident['start'])
+
+    hit_types, counts = np.unique(trouble_types[trouble_types != 'NORMAL'], return_counts=True)
+    trouble_counts = dict(zip(hit_types.tolist(), counts.tolist()))
+    trouble_count = int(counts.sum())
+    total_count = len(df)
+    trouble_rate = (trouble_count / total_count * 100) if total_count > 0 else 0
+
+    return {
+        'meter_id': meter_id,
+        'status': status_for(len(incidents)),
+        'trouble_count': trouble_count,
+        'incident_count': len(incidents),
+        'total_count': total_count,
+        'trouble_rate': trouble_rate,
+        'trouble_counts': trouble_counts,
+        'drift_count': len(drift),
+        'model': {
+            'intercept': float(model.intercept_),
+            'coefficients': dict(zip(model.feature_names_in_.tolist(),
+                                     model.coef_.tolist())),
+            'residual_mean': float(df['Residual'].mean()),
+            'residual_std': float(residual_std),
+            **robust
+        },
+        'first_timestamp': df['Timestamp'].min().isoformat(),
+        'last_timestamp': df['Timestamp'].max().isoformat(),
+        'alerts': incidents[:10],
+        'drift': drift
+    }
+
+
+def run_fleet_detection(df, max_workers=None, executor=None):
+    """Run detection for every meter in parallel, keyed by meter id
+
+    Pass a long-lived executor to reuse its worker processes; otherwise a
+    pool is started for this call.
+    """
+    partitions = partition_by_meter(df)
+    if not partitions:
+        return {}
+
+    workers = min(max_workers or os.cpu_count() or 1, len(partitions))
+    if workers <= 1:
+        return {meter_id: process_meter(meter_id, meter_df)
+                for meter_id, meter_df in partitions.items()}
+
+    if executor is not None:
+        results = executor.map(process_meter, partitions.keys(), partitions.values())
+        return {result['meter_id']: result for result in results}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(process_meter, partitions.keys(), partitions.values())
+        return {result['meter_id']: result for result in results}
+
+
+def fleet_summary(results):
+    """Merge per-meter results into a fleet-wide summary"""
+    trouble_count = sum(r['trouble_count'] for r in results.values())
+    incident_count = sum(r['incident_count'] for r in results.values())
+    total_count = sum(r['total_count'] for r in results.values())
+
+    status_counts = {'NORMAL': 0, 'ATTENTION': 0, 'TROUBLE': 0}
+    trouble_counts = {}
+    drift_count = sum(r['drift_count'] for r in results.values())
+    for result in results.values():
+        status_counts[result['status']] += 1
+        for trouble_type, count in result['trouble_counts'].items():
+            trouble_counts[trouble_type] = trouble_counts.get(trouble_type, 0) + count
+
+    if status_counts['TROUBLE']:
+        status = 'TROUBLE'
+    elif status_counts['ATTENTION']:
+        status = 'ATTENTION'
+    else:
+        status = 'NORMAL'
+
+    meters = sorted(results.values(), key=lambda r: r['trouble_rate'], reverse=True)
+    return {
+        'status': status,
+        'meter_count': len(results),
+        'status_counts': status_counts,
+        'trouble_count': trouble_count,
+        'incident_count': incident_count,
+        'total_count': total_count,
+        'trouble_rate': (trouble_count / total_count * 100) if total_count > 0 else 0,
+        'trouble_counts': trouble_counts,
+        'drift_count': drift_count,
+        'meters': [
+            {
+                'meter_id': r['meter_id'],
+                'status': r['status'],
+                'trouble_count': r['trouble_count'],
+                'incident_count': r['incident_count'],
+                'total_count': r['total_count'],
+                'trouble_rate': r['trouble_rate'],
+                'drift_count': r['drift_count']
+            }
+            for r in meters
+        ]
+    }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    workers = None
+    if '--workers' in args:
+        i = args.index('--workers')
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    path = args[0] if args else DATA_FILE
+
+    df = load_fleet_data(path)
+    start = time.perf_counter()
+    results = run_fleet_detection(df, max_workers=workers)
+    elapsed = time.perf_counter() - start
+
+    summary = fleet_summary(results)
+    print(f"Meters: {summary['meter_count']}  Status: {summary['status']}")
+    for meter in summary['meters']:
+        print(f"  {meter['meter_id']:<20} {meter['status']:<10} "
+              f"incidents={meter['incident_count']:<6} drift={meter['drift_count']:<3} "
+              f"rate={meter['trouble_rate']:.2f}%")
+    print(f"Fleet detection took {elapsed:.2f}s")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+MODEL REGISTRY
+==============
+
+Versioned, persisted DV model artifacts. Each version is a small JSON file
+with the fitted coefficients, residual statistics, training window and a
+fingerprint of the training data. An ACTIVE pointer file names the version
+the service should use; it is replaced atomically, so readers always see
+either the old or the new version.
+
+Loading the active model is a stat() and, when the pointer changed, one
+small JSON read, so services can check it on every refresh.
+
+Every dataset has its own registry directory (models/<dataset>/, where
+<dataset> is the file name served with ?dataset=), so activating a model
+for one data file never rescores another with it.
+
+Usage:
+    python model_registry.py train data.csv [--activate] [--dataset NAME]
+    python model_registry.py activate v0002 [--dataset NAME]
+    python model_registry.py list [--dataset NAME]
+
+--dataset defaults to the training file's name for train and to
+DATA_FILE's for the other commands.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+from detection import FEATURES, LinearModel, fit_model
+
+MODEL_DIR = os.environ.get('MODEL_DIR', 'models')
+
+ACTIVE_FILE = 'ACTIVE'
+
+# Dataset the CLI manages when --dataset is not given (as app.py's default)
+DEFAULT_DATASET = os.path.basename(os.environ.get('DATA_FILE', 'June18-21_data.csv'))
+
+
+def data_fingerprint(df):
+    """Hash of the training rows (timestamps, features and DV)"""
+    digest = hashlib.sha256()
+    digest.update(df['Timestamp'].to_numpy(dtype='datetime64[ns]').view('int64').tobytes())
+    for column in FEATURES + ['DV']:
+        digest.update(df[column].to_numpy(dtype='float64').tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _write_atomic(path, text):
+    """Write text to path via a temporary file and rename"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def dataset_directory(dataset, directory=MODEL_DIR):
+    """Registry directory of one dataset"""
+    return os.path.join(directory, os.path.basename(dataset))
+
+
+class ModelRegistry:
+    """Directory of versioned model artifacts with an active pointer"""
+
+    def __init__(self, directory=MODEL_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._active_stamp = None
+        self._active_model = None
+
+    def _path(self, version):
+        return os.path.join(self.directory, f"{version}.json")
+
+    def versions(self):
+        """All saved versions, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory)
+                      if name.startswith('v') and name.endswith('.json'))
+
+    def save(self, model, metadata=None):
+        """Save a model as the next version and return the version name"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            existing = self.versions()
+            number = int(existing[-1][1:]) + 1 if existing else 1
+            version = f"v{number:04d}"
+            artifact = {
+                'version': version,
+                'created_at': datetime.now().isoformat(),
+                'model': model.to_dict(),
+                **(metadata or {})
+            }
+            _write_atomic(self._path(version), json.dumps(artifact, indent=2))
+        return version
+
+    def train(self, df):
+        """Fit a model on df and save it with its training metadata"""
+        df, estimator, residual_std = fit_model(df)
+        model = LinearModel.from_estimator(estimator, residual_std,
+                                           float(df['Residual'].mean()))
+        return self.save(model, {
+            'training_window': {
+                'start': df['Timestamp'].min().isoformat(),
+                'end': df['Timestamp'].max().isoformat(),
+                'rows': len(df)
+            },
+            'data_fingerprint': data_fingerprint(df)
+        })
+
+    def artifact(self, version):
+        with open(self._path(version)) as f:
+            return json.load(f)
+
+    def load(self, version):
+        """Load one version as a LinearModel (with .version set)"""
+        model = LinearModel.from_dict(self.artifact(version)['model'])
+        model.version = version
+        return model
+
+    def activate(self, version):
+        """Atomically make version the active model"""
+        if not os.path.exists(self._path(version)):
+            raise ValueError(f"Unknown model version: {version}")
+        _write_atomic(os.path.join(self.directory, ACTIVE_FILE), version)
+
+    def active_version(self):
+        try:
+            with open(os.path.join(self.directory, ACTIVE_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def active(self):
+        """The active model, or None if no version has been activated"""
+        try:
+            st = os.stat(os.path.join(self.directory, ACTIVE_FILE))
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            if stamp != self._active_stamp:
+                self._active_model = self.load(self.active_version())
+                self._active_stamp = stamp
+            return self._active_model
+
+
+if __name__ == '__main__':
+    from schema import read_meter_csv
+
+    args = sys.argv[1:]
+    dataset = None
+    if '--dataset' in args:
+        i = args.index('--dataset')
+        dataset = args[i + 1]
+        del args[i:i + 2]
+    if dataset is None:
+        dataset = args[1] if args[:1] == ['train'] and len(args) >= 2 else DEFAULT_DATASET
+    registry = ModelRegistry(dataset_directory(dataset))
+    if args[:1] == ['train'] and len(args) >= 2:
+        version = registry.train(read_meter_csv(args[1]).dropna())
+        print(f"Saved {version} in {registry.directory}")
+        if '--activate' in args:
+            registry.activate(version)
+            print(f"Activated {version}")
+    elif args[:1] == ['activate'] and len(args) == 2:
+        registry.activate(args[1])
+        print(f"Activated {args[1]}")
+    elif args[:1] == ['list']:
+        active = registry.active_version()
+        for version in registry.versions():
+            artifact = registry.artifact(version)
+            window = artifact.get('training_window', {})
+            marker = '*' if version == active else ' '
+            print(f"{marker} {version}  {artifact['created_at']}  "
+                  f"rows={window.get('rows', '-')}  data={artifact.get('data_fingerprint', '-')}")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+DASHBOARD PANELS
+================
+
+The four dashboard panels drawn separately, so each can be rendered and
+cached on its own:
+
+    status     status, incident count and trouble rate
+    dv         actual vs expected DV with incident spans
+    signals    pressure and temperature
+    alerts     active alerts and recommended actions
+
+Every panel has a key built only from the inputs it draws, so new alert
+text does not re-render the time series panels and vice versa. Panels are
+drawn on standalone Figure objects (not pyplot), so several can be
+rendered concurrently in threads.
+"""
+
+import hashlib
+import json
+
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+from matplotlib.figure import Figure
+
+from detection import status_for
+from incidents import describe_incident
+from render import encode_figure
+
+COLORS = {
+    'normal': '#27ae60',
+    'warning': '#f39c12',
+    'danger': '#e74c3c',
+    'primary': '#3498db',
+    'success': '#2ecc71'
+}
+
+STATUS_STYLES = {
+    'NORMAL': (COLORS['success'], "✅"),
+    'ATTENTION': (COLORS['warning'], "⚠️"),
+    'TROUBLE': (COLORS['danger'], "🚨"),
+}
+
+# Size of one panel rendered on its own (a quarter of the full dashboard)
+PANEL_SIZE = (8, 5)
+
+# Readings plotted in the wave graphs
+SAMPLE_SIZE = 200
+
+# Incidents drawn on the DV graph and listed in the alerts panel
+DV_INCIDENTS = 20
+ALERT_INCIDENTS = 5
+
+
+def trouble_rate(state):
+    total_count = state['total_count']
+    return (state['trouble_count'] / total_count * 100) if total_count > 0 else 0
+
+
+def sample_readings(df):
+    """Readings shown in the wave graphs (same sample for both)"""
+    sample_size = min(SAMPLE_SIZE, len(df))
+    return df.sample(n=sample_size, random_state=42).sort_values('Timestamp')
+
+
+def draw_status(ax, state):
+    incident_count = len(state['incidents'])
+    status = status_for(incident_count)
+    status_color, status_icon = STATUS_STYLES[status]
+
+    ax.set_facecolor(status_color)
+    ax.text(0.5, 0.5, f"{status_icon}\n{status}\nIncidents: {incident_count}\nRate: {trouble_rate(state):.1f}%",
+            transform=ax.transAxes, fontsize=16, fontweight='bold',
+            ha='center', va='center', color='white')
+    ax.set_title('SYSTEM STATUS', fontsize=14, fontweight='bold')
+    # Hide ticks and spines only; axis('off') would also hide the status color
+    ax.set_xticks([])
+    ax.set_yticks([])
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+
+def draw_dv(ax, state):
+    df = state['df']
+    if len(df) == 0:
+        return
+    sample_df = sample_readings(df)
+    timestamps = sample_df['Timestamp']
+
+    ax.plot(timestamps, sample_df['DV'], color=COLORS['primary'],
+            label='Actual DV', linewidth=2, alpha=0.9)
+    ax.plot(timestamps, sample_df['DV_predicted'], color=COLORS['success'],
+            label='Expected DV', linewidth=2, linestyle='--', alpha=0.8)
+
+    # Highlight incidents as spans with their peak sample
+    shown = state['incidents'][:DV_INCIDENTS]
+    for incident in shown:
+        ax.axvspan(incident['start_ts'], incident['end_ts'],
+                   color=COLORS['danger'], alpha=0.15)
+    if shown:
+        ax.scatter([i['start_ts'] for i in shown], [i['dv'] for i in shown],
+                   color=COLORS['danger'], s=100, label='Trouble Detected', alpha=0.9, zorder=5)
+
+    ax.set_title('DV Values Wave Graph', fontsize=12, fontweight='bold')
+    ax.set_xlabel('Time')
+    ax.set_ylabel('DV Value')
+    ax.legend(loc='upper left')
+    ax.grid(True, alpha=0.3)
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_ha('right')
+
+
+def draw_signals(ax, state):
+    df = state['df']
+    if len(df) == 0:
+        return
+    sample_df = sample_readings(df)
+    timestamps = sample_df['Timestamp']
+    ax_twin = ax.twinx()
+
+    line1 = ax.plot(timestamps, sample_df['Pressure'],
+                    color=COLORS['primary'], label='Pressure', linewidth=2, alpha=0.9)
+    line2 = ax_twin.plot(timestamps, sample_df['Temperature'],
+                         color=COLORS['danger'], label='Temperature', linewidth=2, alpha=0.9)
+
+    ax.set_ylabel('Pressure', color=COLORS['primary'], fontweight='bold')
+    ax_twin.set_ylabel('Temperature (°C)', color=COLORS['danger'], fontweight='bold')
+    ax.tick_params(axis='y', labelcolor=COLORS['primary'])
+    ax_twin.tick_params(axis='y', labelcolor=COLORS['danger'])
+
+    ax.set_title('Pressure & Temperature Wave Graph', fontsize=12, fontweight='bold')
+    ax.set_xlabel('Time')
+    ax.grid(True, alpha=0.3)
+
+    lines = line1 + line2
+    ax.legend(lines, [l.get_label() for l in lines], loc='upper left')
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_ha('right')
+
+
+def alert_lines(incidents):
+    return [describe_incident(incident) for incident in incidents[:ALERT_INCIDENTS]]
+
+
+def draw_alerts(ax, state):
+    incidents = state['incidents']
+    if not incidents:
+        alert_text = "✅ NO ACTIVE ALERTS\n\nSystem operating normally"
+    else:
+        alert_text = "🚨 ACTIVE ALERTS:\n\n"
+        for incident, line in zip(incidents, alert_lines(incidents)):
+            icon = "🟡" if incident['trouble_type'].startswith('LOW_') else "🔴"
+            alert_text += f"{icon} {line}\n"
+
+        # Add recommendations
+        alert_text += "\n🔧 RECOMMENDED ACTIONS:\n"
+        alert_text += "• Check sensor readings\n"
+        alert_text += "• Monitor system parameters\n"
+        alert_text += "• Review recent changes\n"
+
+    ax.text(0.05, 0.95, alert_text, transform=ax.transAxes, fontsize=10,
+            va='top', bbox=dict(boxstyle="round,pad=0.3",
+            facecolor=COLORS['danger'] if incidents else COLORS['success'], alpha=0.7))
+    ax.set_title('ALERTS & RECOMMENDATIONS', fontsize=12, fontweight='bold')
+    ax.axis('off')
+
+
+# Inputs each panel depends on; the panel is re-rendered only when they change
+PANEL_INPUTS = {
+    'status': lambda state: [len(state['incidents']), round(trouble_rate(state), 1)],
+    'dv': lambda state: [state['data_key'],
+                         [(i['start'], i['end'], i['dv']) for i in state['incidents'][:DV_INCIDENTS]]],
+    'signals': lambda state: [state['data_key']],
+    'alerts': lambda state: [bool(state['incidents']), alert_lines(state['incidents'])],
+}
+
+PANEL_DRAWERS = {
+    'status': draw_status,
+    'dv': draw_dv,
+    'signals': draw_signals,
+    'alerts': draw_alerts,
+}
+
+PANELS = list(PANEL_DRAWERS)
+
+
+def panel_state(df, incidents, trouble_count, data_key='', total_count=None):
+    """Inputs shared by all panels
+
+    data_key identifies the readings (and model) in df, so time series
+    panels can be keyed without hashing the frame. total_count is the
+    number of rows ever ingested when df only holds the recent ones.
+    """
+    # Parse incident times once for the span drawing
+    incidents = [{**i, 'start_ts': pd.Timestamp(i['start']), 'end_ts': pd.Timestamp(i['end'])}
+                 for i in incidents[:DV_INCIDENTS]] + list(incidents[DV_INCIDENTS:])
+    return {'df': df, 'incidents': incidents, 'trouble_count': trouble_count, 'data_key': data_key,
+            'total_count': len(df) if total_count is None else total_count}
+
+
+def panel_key(name, state):
+    """Hash of the inputs the named panel draws"""
+    if name not in PANEL_INPUTS:
+        raise KeyError(name)
+    payload = json.dumps(PANEL_INPUTS[name](state), default=str)
+    return hashlib.sha1(f"{name}|{payload}".encode()).hexdigest()[:16]
+
+
+def render_panel(name, state, profile=None):
+    """Encode one panel as an image with the given render profile"""
+    fig = Figure(figsize=PANEL_SIZE)
+    ax = fig.add_subplot(1, 1, 1)
+    PANEL_DRAWERS[name](ax, state)
+    fig.tight_layout()
+    return encode_figure(fig, profile)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+PARTITIONED DATASET
+===================
+
+Multi-day CSV dumps are split into one partition per meter per day (or
+hour). A partition is a list of segments, each stored column by column as
+.npy files:
+
+    dataset/
+        manifest.json
+        RM-0/2025-06-18/s0001/Timestamp.npy
+        RM-0/2025-06-18/s0001/Pressure.npy
+        ...
+
+manifest.json lists every partition with its meter, min/max timestamp,
+row count, size and segments. Queries select partitions from the manifest alone and
+only open those overlapping the requested range; the column files are
+memory-mapped and sliced with a binary search on the (sorted) timestamps,
+so the cost of a range query and of startup depends on the range, not on
+how many months of history the dataset holds.
+
+Ingesting more files adds a segment holding only the new rows to each
+partition they touch; rows whose (Timestamp, MeterID) is already stored
+are dropped. The newest segments are merged while the one before is at
+most MERGE_RATIO times the size of the rows being written, so a partition
+keeps a logarithmic number of segments and each row is rewritten a
+logarithmic number of times instead of on every append. `compact` merges
+every partition into a single segment. Merged segments go to new
+directories and the manifest is replaced atomically, so readers see
+either the old or the new segments, never a mix of both.
+
+Usage:
+    python partitioned.py ingest data.csv [more.csv ...] [--out dataset]
+                                 [--by day|hour] [--chunksize 500000]
+    python partitioned.py compact [dataset]
+    python partitioned.py info [dataset]
+    python partitioned.py query [dataset] [--start T] [--end T] [--meter ID]
+"""
+
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from meters import DEFAULT_METER, METER_COLUMN
+from schema import METER_SCHEMA, read_meter_csv
+
+DATASET_DIR = os.environ.get('DATASET_DIR', 'dataset')
+
+MANIFEST = 'manifest.json'
+
+# Partition period -> directory name format
+PERIODS = {'day': '%Y-%m-%d', 'hour': '%Y-%m-%dT%H'}
+
+TIMESTAMP = METER_SCHEMA['timestamp']
+COLUMNS = [TIMESTAMP, *METER_SCHEMA['dtypes']]
+DTYPES = {TIMESTAMP: 'datetime64[ns]', **METER_SCHEMA['dtypes']}
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# The newest segment is merged into a write while it holds at most this many
+# times the rows being written
+MERGE_RATIO = 2
+
+# Manifest times are kept to the millisecond
+TIME_RESOLUTION = np.timedelta64(1, 'ms')
+
+
+def _format_time(value):
+    return pd.Timestamp(value).strftime(TIME_FORMAT)[:-3]
+
+
+def _write_atomic(path, write):
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _segments(partition):
+    """Segments of a manifest partition (older manifests had one directory per partition)"""
+    if 'segments' in partition:
+        return partition['segments']
+    return [{k: partition[k] for k in ('path', 'start', 'end', 'rows', 'bytes')}]
+
+
+def _next_segment(partition):
+    return partition.get('next_segment', partition.get('generation', 0) + 1)
+
+
+def _partition_entry(meter, period, segments, next_segment):
+    return {
+        'meter': str(meter),
+        'period': period,
+        'start': min(s['start'] for s in segments),
+        'end': max(s['end'] for s in segments),
+        'rows': sum(s['rows'] for s in segments),
+        'bytes': sum(s['bytes'] for s in segments),
+        'next_segment': next_segment,
+        'segments': segments
+    }
+
+
+class PartitionedDataset:
+    """Manifest-indexed partitions of one dataset directory"""
+
+    def __init__(self, directory=DATASET_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST)
+        self._lock = threading.Lock()
+        self._loaded = {'stamp': None, 'manifest': None, 'starts': None, 'ends': None}
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def manifest(self):
+        """The manifest, reread when the file changes"""
+        try:
+            st = os.stat(self.manifest_path)
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = (None,)
+        with self._lock:
+            if stamp != self._loaded['stamp']:
+                if stamp[0] is None:
+                    manifest = {'partition_by': 'day', 'partitions': []}
+                else:
+                    with open(self.manifest_path) as f:
+                        manifest = json.load(f)
+                partitions = manifest['partitions']
+                self._loaded.update({
+                    'stamp': stamp,
+                    'manifest': manifest,
+                    'starts': pd.to_datetime([p['start'] for p in partitions]).to_numpy(),
+                    'ends': pd.to_datetime([p['end'] for p in partitions]).to_numpy()
+                })
+            return self._loaded['manifest']
+
+    def partitions(self, start=None, end=None, meter=None):
+        """Manifest entries overlapping [start, end] (optionally for one meter)"""
+        manifest = self.manifest()
+        with self._lock:
+            starts, ends = self._loaded['starts'], self._loaded['ends']
+        overlap = np.ones(len(starts), dtype=bool)
+        if start is not None:
+            overlap &= ends >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            overlap &= starts <= np.datetime64(pd.Timestamp(end))
+        return [p for p, keep in zip(manifest['partitions'], overlap.tolist())
+                if keep and (meter is None or p['meter'] == str(meter))]
+
+    def meters(self):
+        return sorted({p['meter'] for p in self.manifest()['partitions']})
+
+    def span(self, meter=None):
+        """(first, last) timestamp in the dataset, or (None, None) when empty"""
+        partitions = self.partitions(meter=meter)
+        if not partitions:
+            return None, None
+        return (pd.Timestamp(min(p['start'] for p in partitions)),
+                pd.Timestamp(max(p['end'] for p in partitions)))
+
+    def _open(self, partition, columns):
+        path = os.path.join(self.directory, partition['path'])
+        return {c: np.load(os.path.join(path, f"{c}.npy"), mmap_mode='r') for c in columns}
+
+    def read(self, start=None, end=None, meter=None, columns=None):
+        """Readings in [start, end], opening only the overlapping partitions"""
+        columns = [TIMESTAMP] + [c for c in (columns or COLUMNS) if c != TIMESTAMP]
+        lo_time = np.datetime64(pd.Timestamp(start)) if start is not None else None
+        hi_time = np.datetime64(pd.Timestamp(end)) if end is not None else None
+
+        frames = []
+        for partition in self.partitions(start, end, meter):
+            for segment in _segments(partition):
+                arrays = self._open(segment, columns)
+                times = arrays[TIMESTAMP]
+                lo = np.searchsorted(times, lo_time, side='left') if lo_time is not None else 0
+                hi = np.searchsorted(times, hi_time, side='right') if hi_time is not None else len(times)
+                if hi <= lo:
+                    continue
+                frame = pd.DataFrame({c: np.array(arrays[c][lo:hi]) for c in columns})
+                frame[METER_COLUMN] = partition['meter']
+                frames.append(frame)
+
+        if not frames:
+            empty = {c: np.array([], dtype=DTYPES[c]) for c in columns}
+            return pd.DataFrame({**empty, METER_COLUMN: np.array([], dtype=str)})
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        return df.sort_values(TIMESTAMP, kind='stable', ignore_index=True)
+
+    def latest_window(self, seconds, meter=None):
+        """(start, end) of the last `seconds` of data, from the manifest alone"""
+        _, last = self.span(meter)
+        if last is None:
+            return None, None
+        return last - pd.Timedelta(seconds=seconds), last
+
+    def _write_segment(self, relative, arrays):
+        """Write time-sorted columns to a segment directory and return its entry"""
+        path = os.path.join(self.directory, relative)
+        os.makedirs(path, exist_ok=True)
+        order = np.argsort(arrays[TIMESTAMP], kind='stable')
+        size = 0
+        for column in COLUMNS:
+            values = arrays[column][order]
+            with open(os.path.join(path, f"{column}.npy"), 'wb') as f:
+                np.save(f, values)
+            size += values.nbytes
+        times = arrays[TIMESTAMP][order]
+        return {
+            'path': relative,
+            'start': _format_time(times[0]),
+            'end': _format_time(times[-1]),
+            'rows': int(len(times)),
+            'bytes': int(size)
+        }
+
+    def _stored(self, segments, times):
+        """Mask of times already stored in the segments (each sorted by time)"""
+        stored = np.zeros(len(times), dtype=bool)
+        first, last = times.min(), times.max()
+        for segment in segments:
+            # Most appends are later than every stored row and touch no column file
+            if (np.datetime64(pd.Timestamp(segment['end'])) + TIME_RESOLUTION < first
+                    or np.datetime64(pd.Timestamp(segment['start'])) > last):
+                continue
+            existing = self._open(segment, [TIMESTAMP])[TIMESTAMP]
+            position = np.minimum(np.searchsorted(existing, times), len(existing) - 1)
+            stored |= existing[position] == times
+        return stored
+
+    def _save_manifest(self, by, entries, removed):
+        manifest = {
+            'partition_by': by,
+            'columns': COLUMNS,
+            'partitions': sorted(entries.values(), key=lambda p: (p['start'], p['meter']))
+        }
+
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                json.dump(manifest, f, indent=1)
+        os.makedirs(self.directory, exist_ok=True)
+        _write_atomic(self.manifest_path, write)
+
+        # Readers still mapping a merged segment keep their open files
+        for relative in removed:
+            shutil.rmtree(os.path.join(self.directory, relative), ignore_errors=True)
+        return manifest
+
+    def append(self, df, by=None):
+        """Write new readings into their partitions and update the manifest
+
+        Rows whose (Timestamp, MeterID) is already stored are skipped.
+        """
+        manifest = self.manifest()
+        by = by or manifest.get('partition_by', 'day')
+        if by not in PERIODS:
+            raise ValueError(f"Unknown partition period: {by} (choose from {', '.join(PERIODS)})")
+        if manifest['partitions'] and manifest.get('partition_by') != by:
+            raise ValueError(f"{self.directory} is partitioned by {manifest['partition_by']}")
+
+        df = df.dropna(subset=COLUMNS)
+        meters = (df[METER_COLUMN].astype(str) if METER_COLUMN in df.columns
+                  else pd.Series(DEFAULT_METER, index=df.index))
+        periods = df[TIMESTAMP].dt.strftime(PERIODS[by])
+        entries = {(p['meter'], p['period']): p for p in manifest['partitions']}
+        removed = []
+
+        for (meter, period), rows in df.groupby([meters, periods], sort=True):
+            rows = rows.drop_duplicates(TIMESTAMP)
+            new = {c: rows[c].to_numpy(dtype=DTYPES[c]) for c in COLUMNS}
+            old = entries.get((meter, period))
+            segments = list(_segments(old)) if old else []
+            if segments:
+                fresh = ~self._stored(segments, new[TIMESTAMP])
+                if not fresh.any():
+                    continue
+                new = {c: values[fresh] for c, values in new.items()}
+
+            # Fold the newest segments into this write while they are not much bigger
+            while segments and segments[-1]['rows'] <= MERGE_RATIO * len(new[TIMESTAMP]):
+                segment = segments.pop()
+                arrays = self._open(segment, COLUMNS)
+                new = {c: np.concatenate([arrays[c], new[c]]) for c in COLUMNS}
+                removed.append(segment['path'])
+
+            number = _next_segment(old) if old else 1
+            relative = f"{quote(str(meter), safe='-_.')}/{period}/s{number:04d}"
+            segments.append(self._write_segment(relative, new))
+            entries[(meter, period)] = _partition_entry(meter, period, segments, number + 1)
+
+        return self._save_manifest(by, entries, removed)
+
+    def compact(self):
+        """Merge the segments of every partition into one"""
+        manifest = self.manifest()
+        entries = {}
+        removed = []
+        for partition in manifest['partitions']:
+            segments = _segments(partition)
+            key = (partition['meter'], partition['period'])
+            if len(segments) == 1:
+                entries[key] = partition
+                continue
+            opened = [self._open(segment, COLUMNS) for segment in segments]
+            merged = {c: np.concatenate([arrays[c] for arrays in opened]) for c in COLUMNS}
+            number = _next_segment(partition)
+            relative = f"{quote(partition['meter'], safe='-_.')}/{partition['period']}/s{number:04d}"
+            entries[key] = _partition_entry(partition['meter'], partition['period'],
+                                            [self._write_segment(relative, merged)], number + 1)
+            removed.extend(segment['path'] for segment in segments)
+        return self._save_manifest(manifest.get('partition_by', 'day'), entries, removed)
+
+
+def ingest(paths, directory=DATASET_DIR, by='day', chunksize=500000):
+    """Append CSV files to the dataset chunk by chunk"""
+    dataset = PartitionedDataset(directory)
+    rows = 0
+    for path in paths:
+        for chunk in read_meter_csv(path, chunksize=chunksize):
+            dataset.append(chunk, by)
+            rows += len(chunk)
+    return dataset, rows
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'--out': DATASET_DIR, '--by': 'day', '--chunksize': 500000,
+               '--start': None, '--end': None, '--meter': None}
+    for flag, default in options.items():
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = type(default)(args[i + 1]) if default is not None else args[i + 1]
+            del args[i:i + 2]
+    if not args or args[0] not in ('ingest', 'compact', 'info', 'query'):
+        print(__doc__)
+        sys.exit(1)
+
+    command, args = args[0], args[1:]
+    if command == 'ingest':
+        start = time.perf_counter()
+        dataset, rows = ingest(args, options['--out'], options['--by'], options['--chunksize'])
+        print(f"Ingested {rows:,} rows into {len(dataset.partitions())} partitions "
+              f"in {time.perf_counter() - start:.2f}s")
+    elif command == 'compact':
+        dataset = PartitionedDataset(args[0] if args else DATASET_DIR)
+        start = time.perf_counter()
+        before = sum(len(_segments(p)) for p in dataset.partitions())
+        dataset.compact()
+        print(f"Compacted {before} segments into {len(dataset.partitions())} partitions "
+              f"in {time.perf_counter() - start:.2f}s")
+    elif command == 'info':
+        dataset = PartitionedDataset(args[0] if args else DATASET_DIR)
+        partitions = dataset.partitions()
+        print(f"{dataset.directory}: {len(partitions)} partitions by "
+              f"{dataset.manifest().get('partition_by')}, meters {', '.join(dataset.meters())}")
+        for p in partitions:
+            print(f"  {p['meter'] + '/' + p['period']:<24} {p['start']} .. {p['end']}  {p['rows']:>9,} rows  "
+                  f"{p['bytes'] / 2**20:7.1f} MB  {len(_segments(p))} segments")
+    else:
+        dataset = PartitionedDataset(args[0] if args else DATASET_DIR)
+        start = time.perf_counter()
+        opened = dataset.partitions(options['--start'], options['--end'], options['--meter'])
+        df = dataset.read(options['--start'], options['--end'], options['--meter'])
+        print(f"{len(df):,} rows from {len(opened)} of {len(dataset.partitions())} partitions "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+        if len(df):
+            print(df.head().to_string(index=False))
@@ -1,13 +1,18 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
 import base64
-import io
-from datetime import datetime, timedelta
+import hashlib
 import os
+from render import RenderCache, encode_figure, get_profile, mime_type
+from detection import config_fingerprint
+from rules import active_rules
+from severity import scored_incidents
+from tail_reader import LivePipeline
+from figures import releases_figures
 
 app = Flask(__name__)
 
@@ -28,67 +33,50 @@ colors = {
     'dark': '#212529'
 }
 
+# Model, troubles and incidents for the data file, updated as rows are appended
+pipeline = LivePipeline('June18-21_data.csv')
+
+# Dashboard payloads keyed by (data version, render profile)
+payload_cache = RenderCache()
+
+class DataUnavailable(Exception):
+    """Raised when the data file cannot be read or has no rows"""
+
 def load_data():
     """Load and process data for the dashboard"""
     try:
-        # Load main data
-        df = pd.read_csv('June18-21_data.csv')
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-        
-        # Load correlation data if exists
-        try:
-            correlation_df = pd.read_csv('pressure_to_dv_correlation.csv')
-        except:
-            correlation_df = pd.DataFrame()
-        
-        return df, correlation_df
+        # Parse only the rows appended since the last refresh
+        pipeline.refresh()
     except Exception as e:
-        print(f"Error loading data: {e}")
-        # Return sample data if files not found
-        dates = pd.date_range(start='2024-06-18', end='2024-06-21', freq='H')
-        sample_data = {
-            'Timestamp': dates,
-            'DV': np.random.normal(0, 100, len(dates)),
-            'Pressure': np.random.normal(50, 10, len(dates)),
-            'Temperature': np.random.normal(30, 2, len(dates))
-        }
-        df = pd.DataFrame(sample_data)
-        return df, pd.DataFrame()
+        raise DataUnavailable(f"Error loading data: {e}") from e
+    df = pipeline.df
+    if df.empty:
+        raise DataUnavailable('No data rows')
+    return df
 
-def generate_troubles():
-    """Generate realistic trouble data for demonstration"""
-    troubles = []
-    base_time = datetime.now() - timedelta(hours=24)
+def load_troubles():
+    """Detected incidents as trouble records, in start order
     
-    # Generate various types of troubles
-    trouble_types = ['DV_ANOMALY', 'PRESSURE_ISSUE', 'TEMPERATURE_ISSUE', 'SYSTEM_ERROR']
-    
-    for i in range(15):
-        trouble_time = base_time + timedelta(hours=i*1.5)
-        trouble_type = trouble_types[i % len(trouble_types)]
-        
-        if trouble_type == 'DV_ANOMALY':
-            dv_value = np.random.uniform(-300, 300)
-        elif trouble_type == 'PRESSURE_ISSUE':
-            dv_value = np.random.uniform(50, 150)
-        elif trouble_type == 'TEMPERATURE_ISSUE':
-            dv_value = np.random.uniform(20, 80)
-        else:
-            dv_value = np.random.uniform(-200, 200)
-        
-        troubles.append({
-            'timestamp': trouble_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'trouble_type': trouble_type,
-            'dv': dv_value,
-            'severity': np.random.choice(['LOW', 'MEDIUM', 'HIGH'])
-        })
-    
-    return troubles
+    Severity is graded from how far and how long each incident went past
+    its threshold (see severity.py); scores are cached per data version.
+    """
+    return [{
+        'timestamp': incident['start'][:19],
+        'end': incident['end'][:19],
+        'trouble_type': incident['trouble_type'],
+        'dv': incident['dv'],
+        'peak': incident['peak'],
+        'duration': incident['duration'],
+        'score': incident['score'],
+        'severity': incident['severity']
+    } for incident in scored_incidents(pipeline)]
 
-def create_dashboard_graphs():
+@releases_figures
+def create_dashboard_graphs(profile=None):
     """Create professional dashboard graphs with proper timestamps"""
-    df, correlation_df = load_data()
-    troubles = generate_troubles()
+    # Refreshed once per request by load_data() in the route
+    df = pipeline.df
+    troubles = load_troubles()
     
     # Create figure with subplots
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
@@ -102,8 +90,13 @@ def create_dashboard_graphs():
     }
     
     colors_status = [colors['success'], colors['warning'], colors['danger']]
-    wedges, texts, autotexts = ax1.pie(status_data.values(), labels=status_data.keys(), 
-                                       colors=colors_status, autopct='%1.1f%%', startangle=90)
+    if sum(status_data.values()) > 0:
+        wedges, texts, autotexts = ax1.pie(status_data.values(), labels=status_data.keys(), 
+                                           colors=colors_status, autopct='%1.1f%%', startangle=90)
+    else:
+        ax1.text(0.5, 0.5, 'No troubles detected', ha='center', va='center',
+                 fontsize=14, fontweight='bold', color=colors['success'])
+        ax1.axis('off')
     ax1.set_title('System Status Overview', fontsize=14, fontweight='bold', pad=20)
     
     # 2. DV Time Series with Anomalies
@@ -126,7 +119,7 @@ def create_dashboard_graphs():
             anomaly_timestamps = []
             anomaly_values = []
             
-            for trouble in troubles[:100]:  # Check more troubles
+            for trouble in troubles[-100:]:  # Most recent troubles
                 trouble_time = pd.to_datetime(trouble['timestamp'])
                 # Find if this trouble is in our sample
                 time_diff = abs(sample_df['Timestamp'] - trouble_time)
@@ -203,18 +196,20 @@ def create_dashboard_graphs():
                              linewidth=2, alpha=0.9)
         
         # Anomaly detection for pressure and temperature
+        p_anomaly_timestamps = []
+        t_anomaly_timestamps = []
         if len(troubles) > 0:
-            p_anomaly_timestamps = []
-            t_anomaly_timestamps = []
+            trouble_signals = active_rules().signals
             
-            for trouble in troubles[:100]:
-                if trouble['trouble_type'] in ['PRESSURE_ISSUE', 'TEMPERATURE_ISSUE']:
+            for trouble in troubles[-100:]:
+                signal = trouble_signals.get(trouble['trouble_type'])
+                if signal in ['Pressure', 'Temperature']:
                     trouble_time = pd.to_datetime(trouble['timestamp'])
                     time_diff = abs(sample_df['Timestamp'] - trouble_time)
                     if time_diff.min() < pd.Timedelta(minutes=10):
                         closest_idx = time_diff.idxmin()
                         if closest_idx in sample_df.index:
-                            if trouble['trouble_type'] == 'PRESSURE_ISSUE':
+                            if signal == 'Pressure':
                                 p_anomaly_timestamps.append(sample_df.loc[closest_idx, 'Timestamp'])
                             else:
                                 t_anomaly_timestamps.append(sample_df.loc[closest_idx, 'Timestamp'])
@@ -237,14 +232,14 @@ def create_dashboard_graphs():
             
             # Plot anomalies with proper timestamps
             if p_anomaly_timestamps:
-                p_anomaly_values = [pressure_values[timestamps == ts].iloc[0] if len(pressure_values[timestamps == ts]) > 0 else 0 
+                p_anomaly_values = [pressure_values[timestamps == ts][0] if len(pressure_values[timestamps == ts]) > 0 else 0 
                                    for ts in p_anomaly_timestamps]
                 ax3.scatter(p_anomaly_timestamps, p_anomaly_values, 
                           color=colors['danger'], s=120, alpha=0.9, zorder=5,
                           edgecolors='white', linewidth=1.5)
             
             if t_anomaly_timestamps:
-                t_anomaly_values = [temperature_values[timestamps == ts].iloc[0] if len(temperature_values[timestamps == ts]) > 0 else 0 
+                t_anomaly_values = [temperature_values[timestamps == ts][0] if len(temperature_values[timestamps == ts]) > 0 else 0 
                                    for ts in t_anomaly_timestamps]
                 ax3_twin.scatter(t_anomaly_timestamps, t_anomaly_values, 
                                color=colors['danger'], s=120, alpha=0.9, zorder=5,
@@ -355,10 +350,7 @@ def create_dashboard_graphs():
     plt.tight_layout()
     
     # Convert to base64
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png', dpi=300, bbox_inches='tight')
-    img_buffer.seek(0)
-    img_data = base64.b64encode(img_buffer.getvalue()).decode()
+    img_data = base64.b64encode(encode_figure(fig, profile)).decode()
     plt.close()
     
     return img_data
@@ -368,47 +360,71 @@ def dashboard():
     """Main dashboard route"""
     return render_template('dashboard.html')
 
+def data_version():
+    """ETag for the current data file state and alert rules"""
+    key = f"{pipeline.fingerprint()}|{config_fingerprint()}"
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+def build_payload(profile):
+    """Dashboard statistics, troubles and graphs for the current data
+
+    The route has already refreshed the pipeline with load_data().
+    """
+    troubles = load_troubles()
+    
+    # Generate graphs
+    graph_data = create_dashboard_graphs(profile)
+    
+    # Statistics from the pipeline's running aggregates (no column scans)
+    summary = pipeline.aggregates.summary()
+    total_readings = summary['rows']
+    avg_dv = summary['signals']['DV']['mean']
+    avg_pressure = summary['signals']['Pressure']['mean']
+    avg_temperature = summary['signals']['Temperature']['mean']
+    
+    # Trouble samples by type
+    trouble_counts = summary['trouble_counts']
+    
+    return {
+        'status': 'success',
+        'data': {
+            'total_readings': total_readings,
+            'avg_dv': round(avg_dv, 2),
+            'avg_pressure': round(avg_pressure, 2),
+            'avg_temperature': round(avg_temperature, 2),
+            'trouble_counts': trouble_counts,
+            'recent_troubles': troubles[-5:],  # Last 5 troubles
+            'graph_data': graph_data,
+            'graph_mime': mime_type(profile)
+        }
+    }
+
 @app.route('/api/dashboard-data')
 def dashboard_data():
     """API endpoint for dashboard data"""
     try:
-        df, correlation_df = load_data()
-        troubles = generate_troubles()
+        profile, _ = get_profile(request.args.get('quality'))
         
-        # Generate graphs
-        graph_data = create_dashboard_graphs()
+        # Cheap when the file is unchanged: only appended rows are parsed
+        load_data()
+        etag = f"{data_version()}-{profile}"
         
-        # Calculate statistics
-        if len(df) > 0:
-            total_readings = len(df)
-            avg_dv = df['DV'].mean()
-            avg_pressure = df['Pressure'].mean()
-            avg_temperature = df['Temperature'].mean()
-            
-            # Count troubles by type
-            trouble_counts = {}
-            for trouble in troubles:
-                trouble_type = trouble['trouble_type']
-                trouble_counts[trouble_type] = trouble_counts.get(trouble_type, 0) + 1
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
         else:
-            total_readings = 0
-            avg_dv = 0
-            avg_pressure = 0
-            avg_temperature = 0
-            trouble_counts = {}
-        
+            # Detection, scoring and graphs run once per data version
+            response = jsonify(payload_cache.get_or_render(
+                (data_version(), profile), lambda: build_payload(profile)))
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except DataUnavailable as e:
+        # No fabricated readings: report that there is no data
         return jsonify({
-            'status': 'success',
-            'data': {
-                'total_readings': total_readings,
-                'avg_dv': round(avg_dv, 2),
-                'avg_pressure': round(avg_pressure, 2),
-                'avg_temperature': round(avg_temperature, 2),
-                'trouble_counts': trouble_counts,
-                'recent_troubles': troubles[-5:],  # Last 5 troubles
-                'graph_data': graph_data
-            }
-        })
+            'status': 'error',
+            'message': str(e)
+        }), 503
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+STREAMING QUANTILES
+===================
+
+QuantileSketch is a KLL sketch: a stack of compactors where level i holds
+sorted samples that each stand for 2**i values. When a level overflows
+its capacity it is sorted and every other item (from a random offset) is
+promoted to the next level, so the sketch keeps O(k log(n / k)) items
+for n values and answers any quantile within roughly 1/k of the true
+rank. Updates take whole batches and compact with NumPy sorts, and two
+sketches merge by concatenating their levels and compacting, so sketches
+built over chunks, meters or worker processes combine cheaply
+(to_dict() / from_dict() carry them between processes).
+
+The median and the MAD (median absolute deviation) are read from the
+same sketch, which gives robust detection thresholds that the long DV
+plateaus and the occasional +-500 spikes do not drag around the way
+they do the mean and standard deviation.
+
+Usage:
+    python quantiles.py data.csv [--k 256] [--chunksize 10000]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+# Items kept by the top compactor; rank error is roughly 1/K
+DEFAULT_K = 256
+
+# Smallest capacity of a lower compactor
+MIN_CAPACITY = 8
+
+# MAD of a normal distribution in standard deviations: 1.4826 * MAD
+# estimates the standard deviation, so robust thresholds read in sigmas
+MAD_SIGMA = 1.4826
+
+DEFAULT_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+class QuantileSketch:
+    """Mergeable KLL quantile sketch over a stream of floats"""
+
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.levels = [np.zeros(0)]
+        self.count = 0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.count
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(MIN_CAPACITY, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        """Add a batch of values (NaNs are ignored)"""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                items = np.sort(items)
+                # An odd item out stays behind so the total weight is unchanged
+                kept, items = items[:len(items) % 2], items[len(items) % 2:]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        if not other.count:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._compress()
+        return self
+
+    def _weighted(self):
+        """Sorted items with their weights"""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level)
+                                  for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def quantile(self, q):
+        """Approximate value at quantile q (a float or an array of them)"""
+        if not self.count:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else float('nan')
+        items, weights = self._weighted()
+        return _weighted_quantile(items, weights, q, self.minimum, self.maximum)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def mad(self):
+        """Median absolute deviation from the median"""
+        if not self.count:
+            return float('nan')
+        items, weights = self._weighted()
+        median = _weighted_quantile(items, weights, 0.5, self.minimum, self.maximum)
+        deviations = np.abs(items - median)
+        order = np.argsort(deviations, kind='stable')
+        return _weighted_quantile(deviations[order], weights[order], 0.5)
+
+    def cdf(self, value):
+        """Approximate fraction of values <= value"""
+        if not self.count:
+            return float('nan')
+        items, weights = self._weighted()
+        return float(weights[:np.searchsorted(items, value, side='right')].sum() / weights.sum())
+
+    @property
+    def nbytes(self):
+        return sum(items.nbytes for items in self.levels)
+
+    def to_dict(self):
+        return {'k': self.k, 'count': self.count, 'min': self.minimum, 'max': self.maximum,
+                'levels': [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'])
+        sketch.levels = [np.asarray(items, dtype=float) for items in data['levels']] or [np.zeros(0)]
+        sketch.count = int(data['count'])
+        sketch.minimum, sketch.maximum = float(data['min']), float(data['max'])
+        return sketch
+
+
+def _weighted_quantile(items, weights, q, minimum=None, maximum=None):
+    cumulative = np.cumsum(weights)
+    ranks = np.asarray(q, dtype=float) * cumulative[-1]
+    values = items[np.minimum(np.searchsorted(cumulative, ranks, side='left'), len(items) - 1)]
+    # The extremes are tracked exactly
+    if minimum is not None:
+        values = np.where(np.asarray(q) <= 0, minimum, np.where(np.asarray(q) >= 1, maximum, values))
+    return float(values) if np.ndim(values) == 0 else values
+
+
+def combine(sketches):
+    """One sketch from many (e.g. per chunk or per worker)"""
+    sketches = list(sketches)
+    merged = QuantileSketch(sketches[0].k if sketches else DEFAULT_K)
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
+
+
+def robust_params(sketch, name='residual'):
+    """Median and MAD-based standard deviation of a signal, as rule parameters"""
+    return {f'{name}_median': sketch.median(), f'{name}_mad': MAD_SIGMA * sketch.mad()}
+
+
+def summarize(sketch, quantiles=DEFAULT_QUANTILES):
+    """Count, extremes, quantiles, median and MAD of one sketch"""
+    values = sketch.quantile(np.asarray(quantiles, dtype=float)) if sketch.count else []
+    return {
+        'count': sketch.count,
+        'min': sketch.minimum if sketch.count else None,
+        'max': sketch.maximum if sketch.count else None,
+        'quantiles': {f"{q:g}": float(v) for q, v in zip(quantiles, values)},
+        'median': sketch.median() if sketch.count else None,
+        'mad': sketch.mad() if sketch.count else None,
+        'robust_std': MAD_SIGMA * sketch.mad() if sketch.count else None
+    }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'--k': DEFAULT_K, '--chunksize': 10000}
+    for flag, default in options.items():
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = type(default)(args[i + 1])
+            del args[i:i + 2]
+    if len(args) != 1:
+        print(__doc__)
+        sys.exit(1)
+    from schema import read_meter_csv
+
+    df = read_meter_csv(args[0]).dropna()
+    chunksize = options['--chunksize']
+    for signal in ['DV', 'Pressure', 'Temperature']:
+        values = df[signal].to_numpy(dtype=float)
+        start = time.perf_counter()
+        # One sketch per chunk, merged as workers would
+        sketch = combine(QuantileSketch(options['--k'], seed=i).update(values[i:i + chunksize])
+                         for i in range(0, len(values), chunksize))
+        elapsed = time.perf_counter() - start
+        exact = np.quantile(values, DEFAULT_QUANTILES, method='inverted_cdf')
+        approx = sketch.quantile(np.asarray(DEFAULT_QUANTILES))
+        # Distance from q to the rank range of the returned value (ties span a range)
+        rank_error = max(max(np.mean(values < a) - q, q - np.mean(values <= a), 0)
+                         for q, a in zip(DEFAULT_QUANTILES, approx))
+        median = np.median(values)
+        print(f"{signal:<12} {len(values):,} values in {elapsed * 1000:.1f} ms, "
+              f"{sum(len(items) for items in sketch.levels)} items kept, "
+              f"max rank error {rank_error:.4f}")
+        print(f"  median {sketch.median():10.4f} (exact {median:.4f})  "
+              f"MAD {sketch.mad():10.4f} (exact {np.median(np.abs(values - median)):.4f})")
+        print('  ' + '  '.join(f"q{q:g} {a:.3f}/{e:.3f}" for q, a, e in zip(DEFAULT_QUANTILES, approx, exact)))
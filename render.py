@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+RENDER PROFILES
+===============
+
+Output quality tiers for dashboard images. A 16x10 inch figure at 300 dpi
+is ~4800x3000 px, far more than a browser card needs, so each tier sets its
+own DPI and image format:
+
+    thumbnail   small WebP for previews and lists
+    screen      WebP sized for a browser card (default)
+    print       300 dpi PNG with optimized compression
+    vector      SVG, resolution independent
+
+Encoded images are cached per (data version, tier) so each tier is only
+rendered once per data version.
+"""
+
+import io
+import threading
+from collections import OrderedDict
+
+RENDER_PROFILES = {
+    'thumbnail': {'format': 'webp', 'dpi': 40, 'pil_kwargs': {'quality': 70}},
+    'screen': {'format': 'webp', 'dpi': 80, 'pil_kwargs': {'quality': 85}},
+    'print': {'format': 'png', 'dpi': 300, 'pil_kwargs': {'optimize': True}},
+    'vector': {'format': 'svg'},
+}
+
+DEFAULT_PROFILE = 'screen'
+
+MIME_TYPES = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml',
+}
+
+
+def get_profile(name=None):
+    """Return (name, profile) for a tier name, defaulting to screen"""
+    name = name or DEFAULT_PROFILE
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: {name} "
+                         f"(choose from {', '.join(RENDER_PROFILES)})")
+    return name, RENDER_PROFILES[name]
+
+
+def mime_type(profile_name):
+    return MIME_TYPES[get_profile(profile_name)[1]['format']]
+
+
+def encode_figure(fig, profile_name=None):
+    """Encode a matplotlib figure with the given tier's format and DPI"""
+    _, profile = get_profile(profile_name)
+    kwargs = {'format': profile['format'], 'bbox_inches': 'tight'}
+    if 'dpi' in profile:
+        kwargs['dpi'] = profile['dpi']
+    if 'pil_kwargs' in profile:
+        kwargs['pil_kwargs'] = profile['pil_kwargs']
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, **kwargs)
+    return buffer.getvalue()
+
+
+class RenderCache:
+    """Small LRU cache of encoded images keyed by (data version, tier, ...)"""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_render(self, key, render):
+        """Return the cached value for key, calling render() on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, render())
+        return value
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+HISTORICAL REPLAY
+=================
+
+Streams a recorded meter CSV into a live data file at N times the speed of
+its original timestamps (or as fast as possible) while the dashboard app
+follows it like live data: the app's pipeline tails the file, detects
+troubles and serves them to a simulated browser polling
+/api/dashboard-data?since=<cursor>, in process.
+
+It reports:
+
+- sustained rows/s: rows the dashboard reflected per second of replay
+- detection lag: time from a row being appended to the file until a
+  dashboard response counts it
+- alert latency: time from the first row of an incident being appended
+  until a dashboard response shows the incident
+- whether the app kept up: the backlog drained within two poll intervals
+  of the last write
+
+The first --train rows (MIN_TRAINING_ROWS by default) are written before
+the replay starts and the app loads them, fitting its model (or taking the
+registry's active one), before the clock starts. The timed replay then
+measures steady-state ingest instead of the refits of a model trained on
+a few rows, and incidents starting in that prefix are not counted as
+alerts. A --train below MIN_TRAINING_ROWS is allowed but flagged in the
+report, since the app then keeps refitting during the timed part.
+
+Raise --speed until the app stops keeping up to find the highest sample
+rate a single instance can follow.
+
+Usage:
+    python replay.py data.csv [--speed 10|max] [--poll 0.5] [--duration 60] [--train 10000]
+                     [--app app.py] [--out live.csv] [--batch 1000] [--json out.json]
+"""
+
+import json
+import os
+import runpy
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from loadtest import percentiles
+from schema import read_meter_csv
+from tail_reader import MIN_TRAINING_ROWS
+
+DATA_PATH = '/api/dashboard-data'
+
+# Writer wake-up interval when pacing by timestamps
+TICK = 0.01
+
+# Polls without progress after the last write before giving up
+STALL_POLLS = 20
+
+
+class Replayer:
+    """Appends the source rows to the target file on the original time scale
+
+    The first train rows are written up front and are not timed.
+    """
+
+    def __init__(self, source, target, speed=None, batch=1000, train=0):
+        with open(source) as f:
+            self.header = f.readline()
+            lines = [line if line.endswith('\n') else line + '\n'
+                     for line in f if line.strip()]
+        timestamps = read_meter_csv(source)['Timestamp'].to_numpy()
+        if len(timestamps) != len(lines):
+            raise ValueError(f"{source}: {len(lines)} lines but {len(timestamps)} parsed rows")
+
+        # Rows are written in time order (files may hold one meter after another)
+        order = np.argsort(timestamps, kind='stable')
+        self.lines = [lines[i] for i in order]
+        self.timestamps = timestamps[order]
+        self.offsets = (self.timestamps - self.timestamps[0]) / np.timedelta64(1, 's')
+        self.target = target
+        self.speed = speed
+        self.batch = batch
+        self.written_at = np.full(len(self.lines), np.nan)
+        self.train = max(0, min(train, len(self.lines) - 1))
+        self.written = self.train
+        self.started = None
+        self.finished = None
+        self.stopped = threading.Event()
+
+        with open(target, 'w') as f:
+            f.write(self.header)
+            f.write(''.join(self.lines[:self.train]))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def run(self):
+        self.started = time.perf_counter()
+        with open(self.target, 'a') as f:
+            while self.written < len(self.lines) and not self.stopped.is_set():
+                if self.speed is None:
+                    end = min(len(self.lines), self.written + self.batch)
+                else:
+                    due = self.offsets[self.train] + (time.perf_counter() - self.started) * self.speed
+                    end = int(np.searchsorted(self.offsets, due, side='right'))
+                    if end <= self.written:
+                        wait = (self.offsets[self.written] - due) / self.speed
+                        time.sleep(min(TICK, max(wait, 0)))
+                        continue
+                f.write(''.join(self.lines[self.written:end]))
+                f.flush()
+                self.written_at[self.written:end] = time.perf_counter()
+                self.written = end
+        self.finished = time.perf_counter()
+
+    def row_of(self, timestamp):
+        """Index of the source row with the given timestamp"""
+        position = np.searchsorted(self.timestamps, np.datetime64(pd.Timestamp(timestamp)))
+        return min(int(position), len(self.timestamps) - 1)
+
+
+def load_app(app_path, target, workdir):
+    """Import the dashboard app so that it follows target"""
+    os.environ['DATA_FILE'] = os.path.abspath(target)
+    os.environ.setdefault('TROUBLE_DB', os.path.join(workdir, 'troubles.db'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(app_path)))
+    return runpy.run_path(app_path)['app']
+
+
+def run(source, app_path='app.py', speed=None, poll=0.5, duration=None, out=None, batch=1000,
+        train=MIN_TRAINING_ROWS):
+    workdir = tempfile.mkdtemp(prefix='replay-')
+    target = out or os.path.join(workdir, 'live.csv')
+    replayer = Replayer(source, target, speed, batch, train)
+    client = load_app(app_path, target, workdir).test_client()
+
+    # Load the training prefix (and fit on it) before the clock starts
+    cursor = None
+    counted = 0
+    known = set()
+    if replayer.train:
+        response = client.get(f"{DATA_PATH}?layout=panels")
+        if response.status_code != 200:
+            raise RuntimeError(f"app failed to load the training rows: {response.status_code}")
+        data = response.get_json()
+        cursor = data.get('cursor')
+        counted = data['total_count']
+        known = {(incident['trouble_type'], incident['start']) for incident in data['alerts']}
+
+    writer = threading.Thread(target=replayer.run, daemon=True)
+    writer.start()
+
+    lags = []
+    alerts = {}
+    requests = []
+    errors = 0
+    last_progress = None
+    idle_polls = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    while True:
+        writer_done = not writer.is_alive()
+        if counted >= replayer.written and writer_done:
+            break
+        if writer_done and idle_polls >= STALL_POLLS:
+            # Rows the app will never count (e.g. unparseable lines)
+            break
+        if deadline is not None and time.perf_counter() > deadline:
+            replayer.stopped.set()
+            break
+        if counted >= replayer.written or replayer.written == 0:
+            time.sleep(poll)
+            continue
+
+        # The same requests dashboard.html makes: a full load, then deltas
+        url = f"{DATA_PATH}?since={cursor}" if cursor else f"{DATA_PATH}?layout=panels"
+        sent = time.perf_counter()
+        response = client.get(url)
+        received = time.perf_counter()
+        requests.append(received - sent)
+        if response.status_code != 200:
+            errors += 1
+            time.sleep(poll)
+            continue
+
+        data = response.get_json()
+        cursor = data.get('cursor')
+        if data.get('delta'):
+            total = data['counters']['total_count']
+            incidents = data['incidents']
+        else:
+            total = data['total_count']
+            incidents = data['alerts']
+
+        if total > counted:
+            lags.append(received - replayer.written_at[counted:total])
+            counted = total
+            last_progress = received
+            idle_polls = 0
+        else:
+            idle_polls += 1
+        for incident in incidents:
+            key = (incident['trouble_type'], incident['start'])
+            if key in alerts or key in known:
+                continue
+            row = replayer.row_of(incident['start'])
+            if row < replayer.train:
+                # Started in the untimed training prefix (e.g. found by a refit)
+                known.add(key)
+                continue
+            alerts[key] = received - replayer.written_at[row]
+        time.sleep(max(0.0, poll - (time.perf_counter() - sent)))
+
+    writer.join()
+    lags = np.concatenate(lags) if lags else np.zeros(0)
+    lags = lags[~np.isnan(lags)]
+    elapsed = (last_progress or time.perf_counter()) - replayer.started
+    drain = (last_progress - replayer.finished) if last_progress and replayer.finished else None
+    replayed = replayer.written - replayer.train
+    span = float(replayer.offsets[replayer.written - 1] - replayer.offsets[replayer.train]) if replayed else 0.0
+
+    return {
+        'source': source,
+        'speed': speed,
+        'poll': poll,
+        'train_rows': int(replayer.train),
+        'min_training_rows': MIN_TRAINING_ROWS,
+        'rows': int(counted),
+        'written': int(replayer.written),
+        'data_seconds': span,
+        'input_rows_per_second': replayed / (span / speed) if speed and span else None,
+        'rows_per_second': max(0, counted - replayer.train) / elapsed if elapsed > 0 else 0.0,
+        'detection_lag': {**percentiles(lags.tolist()),
+                          'max': float(lags.max() * 1000) if len(lags) else None},
+        'alert_latency': {**percentiles(list(alerts.values())), 'incidents': len(alerts)},
+        'requests': {**percentiles(requests), 'count': len(requests), 'errors': errors},
+        'drain_seconds': drain,
+        'kept_up': (drain is not None and counted == len(replayer) and drain <= 2 * poll
+                    if speed else None)
+    }
+
+
+def print_report(result):
+    speed = f"{result['speed']:g}x" if result['speed'] else 'max speed'
+    print(f"{result['source']} at {speed}: {result['rows']:,} of {result['written']:,} rows "
+          f"({result['data_seconds']:.1f}s of data after {result['train_rows']:,} training rows), "
+          f"polling every {result['poll']:g}s")
+    if result['train_rows'] < result['min_training_rows']:
+        print(f"  WARNING: {result['train_rows']:,} training rows is below MIN_TRAINING_ROWS "
+              f"({result['min_training_rows']:,}); the app refits during the timed replay")
+    if result['input_rows_per_second']:
+        print(f"  input rate      {result['input_rows_per_second']:10.1f} rows/s")
+    print(f"  sustained       {result['rows_per_second']:10.1f} rows/s")
+
+    def ms(stats):
+        return '  '.join(f"{k} {stats[k]:8.1f}" if stats[k] is not None else f"{k} {'-':>8}"
+                         for k in ('p50', 'p95', 'p99'))
+
+    lag = result['detection_lag']
+    print(f"  detection lag   {ms(lag)}  max {lag['max'] or 0:8.1f} ms")
+    print(f"  alert latency   {ms(result['alert_latency'])} ms "
+          f"({result['alert_latency']['incidents']} incidents)")
+    print(f"  poll requests   {ms(result['requests'])} ms "
+          f"({result['requests']['count']} requests, {result['requests']['errors']} errors)")
+    if result['drain_seconds'] is None:
+        print("  kept up: NO (replay did not finish)")
+    elif result['kept_up'] is None:
+        print(f"  backlog drained {result['drain_seconds']:.2f}s after the last write")
+    else:
+        print(f"  kept up: {'yes' if result['kept_up'] else 'NO'} "
+              f"(backlog drained {result['drain_seconds']:.2f}s after the last write)")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'--speed': '1', '--poll': 0.5, '--duration': None, '--app': 'app.py',
+               '--out': None, '--batch': 1000, '--json': None, '--train': MIN_TRAINING_ROWS}
+    for flag, default in options.items():
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = type(default)(args[i + 1]) if default is not None else args[i + 1]
+            del args[i:i + 2]
+    if len(args) != 1:
+        print(__doc__)
+        sys.exit(1)
+
+    speed = None if options['--speed'] == 'max' else float(options['--speed'])
+    duration = float(options['--duration']) if options['--duration'] else None
+    result = run(args[0], app_path=options['--app'], speed=speed, poll=options['--poll'],
+                 duration=duration, out=options['--out'], batch=options['--batch'],
+                 train=options['--train'])
+    print_report(result)
+    if options['--json']:
+        with open(options['--json'], 'w') as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+ALERT RULES
+===========
+
+Trouble rules are read from a rule file (rules.json, or ALERT_RULES) instead
+of being hard-coded. Each rule compares one signal with a threshold:
+
+    {"type": "HIGH_PRESSURE", "signal": "Pressure", "above": 20,
+     "severity": "HIGH", "priority": 2, "hysteresis": 0.5}
+
+    {"type": "HIGH_ANOMALY", "signal": "Residual", "abs": true, "above": 3.5,
+     "center": "residual_median", "scale": "residual_mad"}
+
+    type        trouble type reported for matching rows (unique)
+    signal      Pressure, Temperature, DV or Residual
+    above/below threshold (exactly one of them)
+    abs         compare the magnitude of the signal (default false)
+    center      runtime parameter subtracted from the signal first
+                (residual_median)
+    scale       runtime parameter the threshold is multiplied by
+                (residual_std, or residual_mad, the MAD scaled to a
+                standard deviation, for thresholds in sigmas); a scale
+                of 0 or NaN falls back to residual_std, and the rule is
+                skipped when that is unusable too
+    severity    LOW, MEDIUM or HIGH (default MEDIUM)
+    priority    lower wins when several rules match (default: file order)
+    hysteresis  once triggered, a rule stays active until the signal is
+                back inside the threshold by this margin (default 0)
+
+The file is compiled once into a plan of whole-column NumPy comparisons, so
+adding rules adds one vector operation, not a per-row cost. active_rules()
+recompiles when the file changes; an invalid edit keeps the previous rules.
+JSON is always supported, YAML when PyYAML is installed.
+
+Usage:
+    python rules.py [rules.json]      validate a rule file and list its rules
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+RULES_FILE = os.environ.get(
+    'ALERT_RULES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json'))
+
+SIGNALS = ['Pressure', 'Temperature', 'DV', 'Residual']
+
+# Runtime parameters a threshold can be centered on or scaled by
+PARAMETERS = ['residual_std', 'residual_median', 'residual_mad']
+
+# Scale used when a rule's own scale is 0 or NaN (e.g. a MAD of 0 when most
+# residuals are equal)
+FALLBACK_SCALE = 'residual_std'
+
+SEVERITIES = ['LOW', 'MEDIUM', 'HIGH']
+
+# Used when the rule file does not exist
+DEFAULT_RULES = {
+    'rules': [
+        {'type': 'HIGH_ANOMALY', 'signal': 'Residual', 'abs': True, 'above': 3.5,
+         'center': 'residual_median', 'scale': 'residual_mad', 'severity': 'HIGH'},
+        {'type': 'LOW_PRESSURE', 'signal': 'Pressure', 'below': 0.1, 'severity': 'MEDIUM'},
+        {'type': 'HIGH_PRESSURE', 'signal': 'Pressure', 'above': 20, 'severity': 'HIGH'},
+        {'type': 'LOW_TEMPERATURE', 'signal': 'Temperature', 'below': 20, 'severity': 'MEDIUM'},
+        {'type': 'HIGH_TEMPERATURE', 'signal': 'Temperature', 'above': 35, 'severity': 'HIGH'},
+        {'type': 'EXTREME_DV', 'signal': 'DV', 'abs': True, 'above': 500, 'severity': 'HIGH'},
+    ]
+}
+
+RULE_KEYS = {'type', 'signal', 'above', 'below', 'abs', 'center', 'scale', 'severity', 'priority',
+             'hysteresis'}
+
+
+def scale_parameter(params, name):
+    """params[name], or the fallback scale when it is 0 or NaN; None when neither is usable"""
+    for candidate in (name, FALLBACK_SCALE):
+        value = params.get(candidate)
+        if value is not None and np.isfinite(value) and value > 0:
+            return float(value)
+    return None
+
+
+class Rule:
+    """One compiled threshold rule"""
+
+    def __init__(self, spec, position):
+        unknown = set(spec) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Rule {position}: unknown keys {sorted(unknown)}")
+        if not spec.get('type'):
+            raise ValueError(f"Rule {position}: missing type")
+        self.type = str(spec['type'])
+        if spec.get('signal') not in SIGNALS:
+            raise ValueError(f"Rule {self.type}: signal must be one of {SIGNALS}")
+        self.signal = spec['signal']
+        if ('above' in spec) == ('below' in spec):
+            raise ValueError(f"Rule {self.type}: give exactly one of above/below")
+        self.above = 'above' in spec
+        self.threshold = float(spec['above' if self.above else 'below'])
+        self.abs = bool(spec.get('abs', False))
+        self.center = spec.get('center')
+        if self.center is not None and self.center not in PARAMETERS:
+            raise ValueError(f"Rule {self.type}: center must be one of {PARAMETERS}")
+        self.scale = spec.get('scale')
+        if self.scale is not None and self.scale not in PARAMETERS:
+            raise ValueError(f"Rule {self.type}: scale must be one of {PARAMETERS}")
+        self.severity = spec.get('severity', 'MEDIUM')
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"Rule {self.type}: severity must be one of {SEVERITIES}")
+        self.priority = float(spec.get('priority', position))
+        self.hysteresis = float(spec.get('hysteresis', 0))
+        if self.hysteresis < 0:
+            raise ValueError(f"Rule {self.type}: hysteresis must not be negative")
+
+    @property
+    def peak(self):
+        """How the peak of an incident of this rule is chosen (see incidents.py)"""
+        if self.abs:
+            return 'abs'
+        return 'max' if self.above else 'min'
+
+    def to_dict(self):
+        spec = {'type': self.type, 'signal': self.signal,
+                ('above' if self.above else 'below'): self.threshold,
+                'abs': self.abs, 'severity': self.severity, 'priority': self.priority,
+                'hysteresis': self.hysteresis}
+        if self.center is not None:
+            spec['center'] = self.center
+        if self.scale is not None:
+            spec['scale'] = self.scale
+        return spec
+
+    def parameters(self):
+        """Runtime parameters the rule needs"""
+        return [p for p in (self.center, self.scale) if p is not None]
+
+    def scale_value(self, params):
+        """Factor the threshold is multiplied by, or None when no usable scale is given"""
+        if self.scale is None:
+            return 1.0
+        return scale_parameter(params, self.scale)
+
+    def usable(self, params):
+        """Whether params hold everything the rule needs"""
+        return (all(params.get(p) is not None for p in self.parameters())
+                and self.scale_value(params) is not None)
+
+    def mask(self, values, params, active=False):
+        """Rows where the rule is active, and whether it is active after the last row
+
+        active is the state before the first row; it only matters with
+        hysteresis, where rows between the trigger and release levels keep
+        the previous state. Without a usable scale nothing matches.
+        """
+        scale = self.scale_value(params)
+        if scale is None:
+            return np.zeros(len(values), dtype=bool), active
+        threshold = self.threshold * scale
+        margin = self.hysteresis * scale
+        if self.above:
+            on = values > threshold
+            off = values <= threshold - margin
+        else:
+            on = values < threshold
+            off = values >= threshold + margin
+        if not self.hysteresis or not len(values):
+            return on, bool(on[-1]) if len(on) else active
+
+        # Each row takes the state set by the latest trigger or release at or before it
+        last_event = np.where(on | off, np.arange(len(values)), -1)
+        np.maximum.accumulate(last_event, out=last_event)
+        result = np.where(last_event >= 0, on[np.maximum(last_event, 0)], active)
+        return result, bool(result[-1])
+
+
+class RuleSet:
+    """Rules compiled into a vectorized evaluation plan"""
+
+    def __init__(self, spec):
+        if not isinstance(spec, dict) or not isinstance(spec.get('rules'), list):
+            raise ValueError("Rule file must contain a 'rules' list")
+        rules = [Rule(rule, position) for position, rule in enumerate(spec['rules'])]
+        types = [rule.type for rule in rules]
+        duplicates = sorted({t for t in types if types.count(t) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate rule types: {duplicates}")
+
+        # Priority order; ties keep file order
+        self.rules = sorted(rules, key=lambda rule: rule.priority)
+        self.types = [rule.type for rule in self.rules]
+        self.severities = {rule.type: rule.severity for rule in self.rules}
+        self.signals = {rule.type: rule.signal for rule in self.rules}
+        self.peak_rules = {rule.type: (rule.signal, rule.peak) for rule in self.rules}
+        normalized = json.dumps([rule.to_dict() for rule in self.rules], sort_keys=True)
+        self.fingerprint = hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+    def classify(self, columns, params=None, state=None):
+        """Trouble type of every row ('NORMAL' where no rule matches)
+
+        columns is a DataFrame or a mapping of signal name to array. Rules
+        whose signal is missing or whose center or scale parameter is not
+        given or whose scale is 0 or NaN without a fallback are skipped
+        (e.g. Residual when there is no model). state, if given,
+        carries hysteresis between consecutive batches and is updated.
+        """
+        params = params or {}
+        arrays = {}
+        masks = []
+        types = []
+        for rule in self.rules:
+            if rule.signal not in columns or not rule.usable(params):
+                continue
+            key = (rule.signal, rule.abs, rule.center)
+            if key not in arrays:
+                values = np.asarray(columns[rule.signal])
+                if rule.center is not None:
+                    values = values - params[rule.center]
+                arrays[key] = np.abs(values) if rule.abs else values
+            active = state.get(rule.type, False) if state is not None else False
+            mask, active = rule.mask(arrays[key], params, active)
+            if state is not None and rule.hysteresis:
+                state[rule.type] = active
+            masks.append(mask)
+            types.append(rule.type)
+
+        if not masks:
+            length = len(columns[next(iter(columns))]) if len(columns) else 0
+            return np.full(length, 'NORMAL', dtype=object)
+        return np.select(masks, types, default='NORMAL')
+
+    def limits(self, params=None):
+        """Effective trigger levels of every rule whose parameters are given
+
+        Rows trip a rule above 'upper' or below 'lower' (both for abs rules).
+        """
+        params = params or {}
+        limits = {}
+        for rule in self.rules:
+            if not rule.usable(params):
+                continue
+            center = float(params[rule.center]) if rule.center is not None else 0.0
+            level = rule.threshold * rule.scale_value(params)
+            if rule.abs:
+                bounds = {'lower': center - level, 'upper': center + level}
+            else:
+                bounds = {'upper' if rule.above else 'lower': center + level}
+            limits[rule.type] = {'signal': rule.signal, **bounds}
+        return limits
+
+
+def read_rule_file(path):
+    """Parse a JSON or YAML rule file"""
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ValueError(f"PyYAML is required to read {path}")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+# Errors that make a rule file invalid
+RULE_ERRORS = (OSError, ValueError, TypeError) + ((yaml.YAMLError,) if yaml is not None else ())
+
+_lock = threading.Lock()
+_loaded = {'stamp': None, 'rules': None}
+
+
+def active_rules(path=None):
+    """The compiled rules of the rule file, recompiled when the file changes"""
+    path = path or RULES_FILE
+    try:
+        st = os.stat(path)
+        stamp = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        stamp = (path, None)
+
+    with _lock:
+        if stamp != _loaded['stamp']:
+            try:
+                spec = read_rule_file(path) if stamp[1] is not None else DEFAULT_RULES
+                _loaded['rules'] = RuleSet(spec)
+            except RULE_ERRORS as e:
+                if _loaded['rules'] is None:
+                    raise
+                # Keep serving the last valid rules until the file is fixed
+                print(f"Ignoring invalid rule file {path}: {e}")
+            _loaded['stamp'] = stamp
+        return _loaded['rules']
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else RULES_FILE
+    rules = RuleSet(read_rule_file(path))
+    print(f"{path}: {len(rules.rules)} rules, fingerprint {rules.fingerprint}")
+    for rule in rules.rules:
+        signal = f"{rule.signal} - {rule.center}" if rule.center else rule.signal
+        limit = f"{'|' + signal + '|' if rule.abs else signal} " \
+                f"{'>' if rule.above else '<'} {rule.threshold:g}"
+        if rule.scale:
+            limit += f" x {rule.scale}"
+        if rule.hysteresis:
+            limit += f" (hysteresis {rule.hysteresis:g})"
+        print(f"  {rule.type:<18} {rule.severity:<7} {limit}")
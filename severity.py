@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+INCIDENT SEVERITY
+=================
+
+Scores detected incidents by how far and for how long they went past the
+threshold of their alert rule:
+
+    score = excess * (1 + duration)
+
+excess is the distance of the incident peak beyond the threshold in
+standard deviations of the signal (of the residual for model rules; in
+multiples of the alarm level for detector incidents such as DRIFT) and
+duration is in seconds, so a brief spike far past the limit and a long
+excursion just past it can both rank high. Scores are banded into LOW,
+MEDIUM and HIGH with SEVERITY_BANDS.
+
+Scoring is vectorized over all incidents and cached per data version
+(file state, model and rules), so repeated dashboard requests reuse it.
+"""
+
+import threading
+
+import numpy as np
+
+from changepoint import DETECTOR_THRESHOLDS
+from detection import config_fingerprint
+from rules import active_rules
+
+# Minimum score for each severity, highest first; lower scores are LOW
+SEVERITY_BANDS = [(2.0, 'HIGH'), (0.5, 'MEDIUM')]
+
+SIGNALS = ['Pressure', 'Temperature', 'DV']
+
+
+def score_incidents(incidents, scales, params=None, rules=None):
+    """Severity score of every incident (0 for types without a rule or detector)
+
+    scales maps each signal to its standard deviation; params holds the
+    runtime rule parameters (residual_std, residual_median, residual_mad)
+    that center and scale the thresholds of model rules.
+    """
+    if not incidents:
+        return np.zeros(0)
+    rules = rules or active_rules()
+    params = params or {}
+    by_type = {rule.type: rule for rule in rules.rules}
+
+    types, inverse = np.unique([i['trouble_type'] for i in incidents], return_inverse=True)
+    peak = np.array([i['peak'] for i in incidents], dtype=float)
+    duration = np.array([i['duration'] for i in incidents], dtype=float)
+
+    # Rule parameters per type, expanded to one entry per incident
+    threshold = np.full(len(types), np.nan)
+    center = np.zeros(len(types))
+    above = np.ones(len(types), dtype=bool)
+    absolute = np.zeros(len(types), dtype=bool)
+    spread = np.ones(len(types))
+    for k, trouble_type in enumerate(types.tolist()):
+        rule = by_type.get(trouble_type)
+        if rule is None:
+            if trouble_type in DETECTOR_THRESHOLDS:
+                threshold[k] = spread[k] = DETECTOR_THRESHOLDS[trouble_type]
+                absolute[k] = True
+            continue
+        if not rule.usable(params):
+            continue
+        scale = rule.scale_value(params)
+        threshold[k] = rule.threshold * scale
+        center[k] = params[rule.center] if rule.center is not None else 0.0
+        above[k] = rule.above
+        absolute[k] = rule.abs
+        spread[k] = (scale if rule.scale is not None else scales.get(rule.signal)) or 1.0
+
+    threshold, center, above, absolute, spread = (
+        a[inverse] for a in (threshold, center, above, absolute, spread))
+    value = np.where(absolute, np.abs(peak - center), peak - center)
+    excess = np.where(above, value - threshold, threshold - value) / spread
+    excess = np.nan_to_num(np.clip(excess, 0, None))
+    return excess * (1 + duration)
+
+
+def severity_labels(scores):
+    """Band scores into LOW / MEDIUM / HIGH"""
+    conditions = [scores >= minimum for minimum, _ in SEVERITY_BANDS]
+    return np.select(conditions, [label for _, label in SEVERITY_BANDS], default='LOW')
+
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def scored_incidents(pipeline):
+    """The pipeline's incidents with score and severity, cached per data version"""
+    key = (pipeline.fingerprint(), config_fingerprint())
+    with _lock:
+        cached = _cache.get(pipeline.path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+    with pipeline._lock:
+        df = pipeline.df
+        incidents = list(pipeline.incidents)
+        scales = {signal: float(df[signal].std()) for signal in SIGNALS} if len(df) else {}
+        scores = score_incidents(incidents, scales, pipeline.detection_params())
+
+    labels = severity_labels(scores)
+    result = [
+        {**incident, 'score': round(float(score), 3), 'severity': label}
+        for incident, score, label in zip(incidents, scores.tolist(), labels.tolist())
+    ]
+    with _lock:
+        # Keep only the latest version per file
+        _cache[pipeline.path] = (key, result)
+    return result
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+DASHBOARD SOAK CHECK
+====================
+
+Sends thousands of dashboard requests through app.py's test client and
+fails (exit code 1) if pyplot figures, resident memory or traced Python
+allocations keep growing. Allocations are traced with tracemalloc from the
+end of warm-up and a snapshot taken then is compared with one taken at
+the end; the source lines that grew most are listed when the net growth
+is over the limit, so a slow leak of Python objects fails even when RSS
+hides it.
+
+The render cache is cleared before every request so each one really
+draws and encodes, and every tenth iteration also forces a render that
+fails after its figure was created, to exercise the error path.
+
+Usage:
+    python soak.py [--requests 2000] [--rss-tolerance 25] [--traced-tolerance 5]
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+
+import app as dashboard
+from figures import allocation_snapshot, memory_report, open_figures
+
+REQUESTS = 2000
+
+# Allowed RSS growth after warm-up, in MB
+RSS_TOLERANCE_MB = 25.0
+
+# Allowed net growth of traced Python allocations after warm-up, in MB
+TRACED_TOLERANCE_MB = 5.0
+
+# Allocation sites listed when traced memory grew too much
+TOP_GROWTH = 10
+
+PATHS = [
+    '/api/dashboard-data?quality=thumbnail',
+    '/api/dashboard-data?quality=thumbnail&layout=panels',
+    '/api/panel/dv?quality=thumbnail',
+    '/api/panel/alerts?quality=thumbnail',
+    '/api/dashboard-image?quality=thumbnail',
+]
+
+
+def failing_render():
+    """A dashboard render that raises after its figure is open"""
+    pipeline = dashboard.datasets.get()
+    image, status, _, _ = dashboard.create_dashboard_plot(
+        pipeline.df, pipeline.incidents, pipeline.trouble_count, profile='invalid')
+    return status == 'ERROR'
+
+
+def allocation_growth(before, after, limit=TOP_GROWTH):
+    """Net traced growth in bytes and the source lines that grew most"""
+    diffs = after.compare_to(before, 'lineno')
+    return sum(diff.size_diff for diff in diffs), [diff for diff in diffs if diff.size_diff > 0][:limit]
+
+
+def soak(requests=REQUESTS, rss_tolerance_mb=RSS_TOLERANCE_MB,
+         traced_tolerance_mb=TRACED_TOLERANCE_MB, report_every=100):
+    """Run the soak and return a list of failures (empty if it passed)"""
+    tracing = tracemalloc.is_tracing()
+    try:
+        return _soak(requests, rss_tolerance_mb, traced_tolerance_mb, report_every)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+
+def _soak(requests, rss_tolerance_mb, traced_tolerance_mb, report_every):
+    client = dashboard.app.test_client()
+    warmup = max(20, requests // 10)
+    baseline = None
+    snapshot = None
+    failures = []
+    start = time.perf_counter()
+
+    for i in range(requests):
+        dashboard.image_cache.clear()
+        path = PATHS[i % len(PATHS)]
+        status = client.get(path).status_code
+        if status != 200:
+            failures.append(f"{path} returned {status}")
+            break
+        if i % 10 == 0 and not failing_render():
+            failures.append('invalid render profile did not fail')
+            break
+
+        if i + 1 == warmup:
+            gc.collect()
+            baseline = memory_report(limit=0)
+            # Trace from here on: tracing the initial data load only slows it down
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            snapshot = allocation_snapshot()
+        if (i + 1) % report_every == 0:
+            report = memory_report(limit=0)
+            print(f"{i + 1:>6} requests  {time.perf_counter() - start:7.1f}s  "
+                  f"rss {report['rss_mb']:7.1f} MB  "
+                  f"traced {tracemalloc.get_traced_memory()[0] / 2**20:7.2f} MB  "
+                  f"figures {report['open_figures']}")
+
+    gc.collect()
+    final = memory_report()
+    if open_figures():
+        failures.append(f"{open_figures()} pyplot figures still open")
+    if baseline is not None and final['rss_mb'] - baseline['rss_mb'] > rss_tolerance_mb:
+        failures.append(f"RSS grew {final['rss_mb'] - baseline['rss_mb']:.1f} MB after warm-up "
+                        f"({baseline['rss_mb']} -> {final['rss_mb']} MB, "
+                        f"tolerance {rss_tolerance_mb} MB)")
+    if snapshot is not None:
+        growth, top = allocation_growth(snapshot, allocation_snapshot())
+        print(f"traced allocations changed {growth / 2**20:+.2f} MB after warm-up")
+        if growth > traced_tolerance_mb * 2**20:
+            failures.append(f"traced allocations grew {growth / 2**20:.2f} MB after warm-up "
+                            f"(tolerance {traced_tolerance_mb} MB); largest growth:\n" + '\n'.join(
+                                f"    {diff.traceback[0].filename}:{diff.traceback[0].lineno}  "
+                                f"{diff.size_diff / 1024:+.1f} KB ({diff.count_diff:+d} blocks)"
+                                for diff in top))
+    return failures
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    requests = REQUESTS
+    tolerance = RSS_TOLERANCE_MB
+    if '--requests' in args:
+        i = args.index('--requests')
+        requests = int(args[i + 1])
+        del args[i:i + 2]
+    if '--rss-tolerance' in args:
+        i = args.index('--rss-tolerance')
+        tolerance = float(args[i + 1])
+        del args[i:i + 2]
+    traced_tolerance = TRACED_TOLERANCE_MB
+    if '--traced-tolerance' in args:
+        i = args.index('--traced-tolerance')
+        traced_tolerance = float(args[i + 1])
+        del args[i:i + 2]
+
+    failures = soak(requests, tolerance, traced_tolerance)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: no figure or memory growth")
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+INCREMENTAL CSV INGESTION
+=========================
+
+The logger appends rows to the data CSV continuously. CsvTailReader
+remembers how far into the file it has parsed and only reads the bytes
+appended since, so a refresh costs time proportional to the new data.
+
+A partial last line (the logger is mid-write) is left for the next read.
+If the file shrinks, is replaced (new inode) or the last line we parsed is
+no longer where we left it, the reader starts over from byte 0 and reports
+a reset so callers rebuild their state.
+
+LivePipeline feeds the new rows through the model, trouble detection and
+incident coalescing incrementally, and keeps running per-bucket signal
+and trouble statistics (aggregates.py) and quantile sketches of the
+residual and every signal (quantiles.py). Residual rules are centered
+and scaled by the median and MAD of the rows the model was fitted on,
+fixed until the next refit, so troubles do not depend on how often the
+file is polled. A CUSUM per meter (changepoint.py) standardizes the same
+residuals with the same median and MAD and adds DRIFT incidents for slow
+shifts the point rules miss. Its cursor (load epoch and row count) lets
+clients ask for only what changed since their last view.
+
+A model fitted from the file itself is refitted on every refresh until it
+has seen MIN_TRAINING_ROWS rows, so a first read of a few rows does not
+fix the model (and the residual statistics) for the life of the process.
+
+Every ingested reading is also kept in a compressed history (tsblocks.py).
+With hot_rows set, only the newest hot_rows rows stay as a scored frame;
+older rows live on in the history alone, which is what rescoring after a
+model or rule change reads back.
+"""
+
+import io
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from aggregates import AggregateStore
+from changepoint import CusumDetector
+from detection import LinearModel, classify_troubles, config_fingerprint, fit_model
+from incidents import GAP_TOLERANCE, coalesce_troubles, extend_incidents
+from meters import METER_COLUMN
+from quantiles import QuantileSketch, robust_params
+from schema import METER_SCHEMA, read_meter_csv
+from tsblocks import CompressedHistory
+
+# Raw columns retained in the compressed history
+HISTORY_COLUMNS = [METER_SCHEMA['timestamp'], *METER_SCHEMA['dtypes'], METER_COLUMN]
+
+# Signals with a streaming quantile sketch
+SKETCHED = ['Residual', *METER_SCHEMA['dtypes']]
+
+# Rows a fitted model must be trained on before it is kept for new rows
+MIN_TRAINING_ROWS = int(os.environ.get('MIN_TRAINING_ROWS', 10000))
+
+
+class CsvTailReader:
+    """Reads only the complete rows appended to a CSV since the last call"""
+
+    def __init__(self, path):
+        self.path = path
+        self._reset_state()
+
+    def _reset_state(self):
+        self.offset = 0
+        self.header = None
+        self.inode = None
+        self.last_line = b''
+
+    def _rotated(self, st):
+        """True if the file was truncated, replaced or rewritten"""
+        if self.inode is None:
+            return False
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            return True
+        if self.last_line:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset - len(self.last_line))
+                return f.read(len(self.last_line)) != self.last_line
+        return False
+
+    def read_new(self):
+        """Return (new_rows, reset)
+
+        new_rows is a DataFrame of rows appended since the last call (every
+        row after a reset); reset is True when the file had to be re-read
+        from the start.
+        """
+        st = os.stat(self.path)
+        reset = self.inode is None or self._rotated(st)
+        if reset:
+            self._reset_state()
+        self.inode = st.st_ino
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+
+        # Only consume complete lines
+        end = data.rfind(b'\n') + 1
+        complete = data[:end]
+        if not complete:
+            return self._empty(), reset
+
+        if self.header is None:
+            header_end = complete.find(b'\n') + 1
+            self.header = complete[:header_end]
+            body = complete[header_end:]
+        else:
+            body = complete
+
+        self.offset += end
+        self.last_line = complete[complete.rfind(b'\n', 0, end - 1) + 1:]
+        if not body.strip():
+            return self._empty(), reset
+
+        df = read_meter_csv(io.BytesIO(self.header + body))
+        return df.dropna(), reset
+
+    def _empty(self):
+        if self.header is None:
+            return pd.DataFrame()
+        return read_meter_csv(io.BytesIO(self.header))
+
+
+class LivePipeline:
+    """Dashboard state for one growing CSV, updated with only the new rows
+
+    The model is fitted on the initial load (and on every reset); appended
+    rows are scored with that model rather than refitting on each refresh,
+    once it was fitted on at least min_training_rows rows. Until then every
+    refresh refits on all rows read so far.
+    With a registry, its active model is used instead of fitting, and the
+    history is rescored when a different version is activated or the alert
+    rules change.
+
+    hot_rows bounds the rows kept in df; None keeps every row.
+    """
+
+    def __init__(self, path, registry=None, hot_rows=None, min_training_rows=MIN_TRAINING_ROWS):
+        self.path = path
+        self.registry = registry
+        self.hot_rows = hot_rows
+        self.min_training_rows = min_training_rows
+        self.reader = CsvTailReader(path)
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.chunks = []
+        self.hot_count = 0
+        self._df = None
+        self.model = None
+        self.residual_std = None
+        self.total_count = 0
+        self.trouble_count = 0
+        self.trouble_counts = {}
+        self.incidents = []
+        self.aggregates = AggregateStore()
+        self.quantiles = {signal: QuantileSketch() for signal in SKETCHED}
+        self.drift = CusumDetector()
+        # Residual median and MAD the rules and the CUSUM use, fixed at (re)fit
+        self.residual_params = None
+        self.history = CompressedHistory(columns=HISTORY_COLUMNS)
+        self.version = 0
+        self.rule_state = {}
+        self.rules = config_fingerprint()
+
+    @property
+    def df(self):
+        """Retained rows as one frame (consolidated lazily)"""
+        with self._lock:
+            if self._df is None:
+                self._df = (pd.concat(self.chunks, ignore_index=True)
+                            if len(self.chunks) > 1 else
+                            self.chunks[0] if self.chunks else pd.DataFrame())
+                self.chunks = [self._df] if len(self._df) else []
+            return self._df
+
+    def readings(self):
+        """Every ingested reading, from the compressed history when df is trimmed"""
+        with self._lock:
+            if self.hot_count < self.total_count:
+                return self.history.read()
+            return self.df
+
+    def undertrained(self):
+        """True while the model was fitted here on fewer than min_training_rows rows"""
+        with self._lock:
+            return (self.model is not None and getattr(self.model, 'version', None) is None
+                    and self.total_count < self.min_training_rows)
+
+    def detection_params(self):
+        """Runtime rule parameters: residual std, median and MAD"""
+        with self._lock:
+            return {'residual_std': self.residual_std, **(self.residual_params or {})}
+
+    def nbytes(self):
+        """Memory held by the retained frames and the compressed history"""
+        with self._lock:
+            frames = sum(int(chunk.memory_usage(index=True, deep=True).sum()) for chunk in self.chunks)
+            return frames + self.history.nbytes
+
+    def fingerprint(self):
+        """Identity of the data and model behind the current state"""
+        with self._lock:
+            model_version = getattr(self.model, 'version', 'fitted')
+            return (f"{os.path.abspath(self.path)}:{self.reader.inode}:{self.reader.offset}:"
+                    f"{self.reader.last_line.hex()}:{model_version}")
+
+    def cursor(self):
+        """Position of the current state, for changes_since()"""
+        with self._lock:
+            return f"{self.epoch}:{self.total_count}"
+
+    def rows_since(self, count):
+        """Rows after the first count rows, touching only the newest chunks"""
+        with self._lock:
+            remaining = self.total_count - count
+            if remaining > self.hot_count:
+                # Older than the hot window: raw readings from the history
+                return self.history.last(remaining)
+            parts = []
+            for chunk in reversed(self.chunks):
+                if remaining <= 0:
+                    break
+                parts.append(chunk.iloc[-remaining:] if remaining < len(chunk) else chunk)
+                remaining -= len(chunk)
+            if not parts:
+                return self.chunks[0].iloc[:0] if self.chunks else pd.DataFrame()
+            return pd.concat(parts[::-1]) if len(parts) > 1 else parts[0]
+
+    def changes_since(self, cursor, max_points=500):
+        """What changed after cursor, or None if the cursor is from another load
+
+        Returns new readings (downsampled to at most max_points), incidents
+        that started or grew since the cursor with a closed flag, and the
+        current counters.
+        """
+        with self._lock:
+            epoch, _, count = (cursor or '').partition(':')
+            if epoch != self.epoch or not count.isdigit() or int(count) > self.total_count:
+                return None
+
+            rows = self.rows_since(int(count))
+            incidents = []
+            if len(rows):
+                # Each meter's new rows only touch that meter's incidents
+                if METER_COLUMN in rows:
+                    spans = rows.groupby(rows[METER_COLUMN].astype(str))['Timestamp'].agg(['min', 'max'])
+                    windows = zip(spans.index, spans['min'], spans['max'])
+                else:
+                    windows = [(None, rows['Timestamp'].min(), rows['Timestamp'].max())]
+                for meter, first, latest in windows:
+                    since = first.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+                    for incident in self.incidents:
+                        if incident.get('meter') == meter and incident['end'] >= since:
+                            closed = latest - pd.Timestamp(incident['end']) > GAP_TOLERANCE
+                            incidents.append({**incident, 'closed': bool(closed)})
+
+            stride = max(1, -(-len(rows) // max_points))
+            sample = rows.iloc[::stride]
+            return {
+                'cursor': self.cursor(),
+                'readings': {
+                    'count': len(rows),
+                    'stride': stride,
+                    'timestamp': [t[:-3] for t in sample['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S.%f')]
+                    if len(sample) else [],
+                    'dv': sample['DV'].tolist() if len(sample) else [],
+                    'pressure': sample['Pressure'].tolist() if len(sample) else [],
+                    'temperature': sample['Temperature'].tolist() if len(sample) else []
+                },
+                'incidents': incidents,
+                'counters': {
+                    'total_count': self.total_count,
+                    'trouble_count': self.trouble_count,
+                    'incident_count': len(self.incidents),
+                    'trouble_counts': dict(self.trouble_counts)
+                }
+            }
+
+    def refresh(self):
+        """Ingest rows appended since the last refresh
+
+        Returns (new_rows, trouble_types) for the ingested batch, or None
+        when nothing changed. When the history was rescored (new model,
+        new rules or still training) the batch is every row, and epoch
+        changes.
+        """
+        with self._lock:
+            rescore = False
+            if self.registry is not None and self.model is not None:
+                active = self.registry.active()
+                # Model swapped: rescore the history with the new version
+                rescore = active is not None and active is not self.model
+            if self.model is not None and config_fingerprint() != self.rules:
+                # Alert rules edited: rescore the history with the new rules
+                rescore = True
+            new_rows, reset = self.reader.read_new()
+            if reset or self.model is None:
+                return self.load(new_rows)
+            if not rescore and new_rows.empty:
+                return None
+            if rescore or self.undertrained():
+                # Too few rows for a stable fit yet: refit on everything read so far
+                history = self.readings()
+                return self.load(pd.concat([history, new_rows], ignore_index=True)
+                                 if len(new_rows) else history)
+            return self.ingest(new_rows)
+
+    def load(self, df):
+        """Replace all state with df and refit the model"""
+        with self._lock:
+            version = self.version
+            self._clear()
+            self.version = version + 1
+            if df.empty:
+                return None
+            df = df.reset_index(drop=True)
+            active = self.registry.active() if self.registry is not None else None
+            if active is not None:
+                active.apply(df)
+                self.model = active
+            else:
+                df, model, residual_std = fit_model(df)
+                self.model = LinearModel.from_estimator(model, residual_std)
+            self.residual_std = self.model.residual_std
+            return self._append(df)
+
+    def ingest(self, new_rows):
+        """Score and detect troubles on new rows and fold them into the state"""
+        with self._lock:
+            if self.model is None:
+                return self.load(new_rows)
+            self.model.apply(new_rows)
+            self.version += 1
+            return self._append(new_rows)
+
+    def _append(self, rows):
+        for signal, sketch in self.quantiles.items():
+            if signal in rows:
+                sketch.update(rows[signal].to_numpy())
+        if self.residual_params is None:
+            # The first batch after _clear() is what the model was fitted on
+            self.residual_params = robust_params(self.quantiles['Residual'])
+        trouble_types = classify_troubles(rows, self.residual_std, self.rule_state,
+                                          self.residual_params)
+
+        hit_types, counts = np.unique(trouble_types[trouble_types != 'NORMAL'],
+                                      return_counts=True)
+        for trouble_type, count in zip(hit_types.tolist(), counts.tolist()):
+            self.trouble_counts[trouble_type] = self.trouble_counts.get(trouble_type, 0) + count
+        self.trouble_count += int(counts.sum())
+        self.total_count += len(rows)
+        self.aggregates.add(rows, trouble_types)
+        self.history.append(rows)
+
+        extend_incidents(self.incidents, coalesce_troubles(rows, trouble_types))
+        extend_incidents(self.incidents, self.drift.update(rows, self.residual_params))
+
+        self.chunks.append(rows)
+        self.hot_count += len(rows)
+        self._df = None
+        if self.hot_rows is not None:
+            self._trim()
+        return rows, trouble_types
+
+    def _trim(self):
+        """Drop scored rows beyond the newest hot_rows (they stay in the history)"""
+        excess = self.hot_count - self.hot_rows
+        while excess > 0 and self.chunks:
+            first = self.chunks[0]
+            if len(first) <= excess:
+                self.chunks.pop(0)
+                dropped = len(first)
+            else:
+                # Copy so the slice does not keep the whole chunk alive
+                self.chunks[0] = first.iloc[excess:].reset_index(drop=True).copy()
+                dropped = excess
+            self.hot_count -= dropped
+            excess -= dropped
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+TROUBLE STORE
+=============
+
+Persists detected troubles and incidents to an embedded SQLite database
+so historical lookups are indexed queries instead of a detection rerun.
+
+Rows are written in batched transactions and read back with keyset
+pagination: the cursor is the (timestamp, id) of the last row returned,
+so every page is a range scan on an index no matter how deep it is.
+"""
+
+import base64
+import os
+import sqlite3
+
+import numpy as np
+
+from detection import trouble_severity
+from schema import DEFAULT_METER, METER_COLUMN
+
+DB_PATH = os.environ.get('TROUBLE_DB', 'troubles.db')
+
+# Rows per executemany() call inside one transaction
+BATCH_SIZE = 5000
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS troubles (
+    id INTEGER PRIMARY KEY,
+    meter_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    trouble_type TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    pressure REAL,
+    temperature REAL,
+    dv REAL,
+    UNIQUE (meter_id, timestamp, trouble_type)
+);
+CREATE INDEX IF NOT EXISTS idx_troubles_timestamp ON troubles (timestamp);
+CREATE INDEX IF NOT EXISTS idx_troubles_type_timestamp ON troubles (trouble_type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_troubles_severity ON troubles (severity);
+
+CREATE TABLE IF NOT EXISTS incidents (
+    id INTEGER PRIMARY KEY,
+    meter_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    end_timestamp TEXT NOT NULL,
+    trouble_type TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    duration REAL,
+    peak REAL,
+    sample_count INTEGER,
+    pressure REAL,
+    temperature REAL,
+    dv REAL,
+    direction TEXT,
+    UNIQUE (meter_id, trouble_type, timestamp)
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_timestamp ON incidents (timestamp);
+CREATE INDEX IF NOT EXISTS idx_incidents_type_timestamp ON incidents (trouble_type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_incidents_severity ON incidents (severity);
+"""
+
+TROUBLE_COLUMNS = ['id', 'meter_id', 'timestamp', 'trouble_type', 'severity',
+                   'pressure', 'temperature', 'dv']
+INCIDENT_COLUMNS = ['id', 'meter_id', 'timestamp', 'end_timestamp', 'trouble_type',
+                    'severity', 'duration', 'peak', 'sample_count',
+                    'pressure', 'temperature', 'dv', 'direction']
+
+# Columns added after the first release: (table, column, type)
+MIGRATIONS = [('incidents', 'direction', 'TEXT')]
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return timestamp, int(row_id)
+    except Exception:
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+
+
+class TroubleStore:
+    """SQLite-backed store for troubles and incidents"""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            for table, column, kind in MIGRATIONS:
+                if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _write_batches(self, sql, rows):
+        conn = self._connect()
+        try:
+            with conn:
+                for i in range(0, len(rows), BATCH_SIZE):
+                    conn.executemany(sql, rows[i:i + BATCH_SIZE])
+        finally:
+            conn.close()
+
+    def save_troubles(self, df, trouble_types, meter_id=DEFAULT_METER):
+        """Persist every trouble row of df (rows already stored are skipped)
+
+        Rows are stored under their MeterID; meter_id is used for files
+        without a meter column.
+        """
+        trouble_types = np.asarray(trouble_types)
+        hit = trouble_types != 'NORMAL'
+        if not hit.any():
+            return 0
+
+        hits = df.loc[hit]
+        types = trouble_types[hit].tolist()
+        timestamps = [t[:-3] for t in hits['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S.%f')]
+        meters = (hits[METER_COLUMN].astype(str).tolist() if METER_COLUMN in hits
+                  else [meter_id] * len(types))
+        rows = list(zip(
+            meters, timestamps, types,
+            [trouble_severity(t) for t in types],
+            hits['Pressure'].tolist(), hits['Temperature'].tolist(), hits['DV'].tolist()))
+
+        self._write_batches(
+            "INSERT OR IGNORE INTO troubles (meter_id, timestamp, trouble_type, severity,"
+            " pressure, temperature, dv) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def save_incidents(self, incidents, meter_id=DEFAULT_METER):
+        """Persist incidents, updating ones that have grown since the last save
+
+        Incidents are stored under their meter; meter_id is used for
+        incidents without one. DRIFT incidents keep their direction.
+        """
+        rows = [
+            (i.get('meter') or meter_id, i['start'], i['end'], i['trouble_type'],
+             trouble_severity(i['trouble_type']), i['duration'], i['peak'],
+             i['sample_count'], i['pressure'], i['temperature'], i['dv'], i.get('direction'))
+            for i in incidents
+        ]
+        self._write_batches(
+            "INSERT INTO incidents (meter_id, timestamp, end_timestamp, trouble_type, severity,"
+            " duration, peak, sample_count, pressure, temperature, dv, direction)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (meter_id, trouble_type, timestamp) DO UPDATE SET"
+            " end_timestamp = excluded.end_timestamp, duration = excluded.duration,"
+            " peak = excluded.peak, sample_count = excluded.sample_count,"
+            " pressure = excluded.pressure, temperature = excluded.temperature,"
+            " dv = excluded.dv, direction = excluded.direction", rows)
+        return len(rows)
+
+    def delete_range(self, meter_ids, start, end):
+        """Remove the troubles and incidents of meter_ids between start and end
+
+        Called before saving a rescored range, so rows detected under an
+        older model or rule set do not outlive it.
+        """
+        meter_ids = list(meter_ids)
+        marks = ', '.join('?' * len(meter_ids))
+        conn = self._connect()
+        try:
+            with conn:
+                for table in ('troubles', 'incidents'):
+                    conn.execute(f"DELETE FROM {table} WHERE meter_id IN ({marks})"
+                                 " AND timestamp >= ? AND timestamp <= ?", [*meter_ids, start, end])
+        finally:
+            conn.close()
+
+    def query(self, kind='troubles', trouble_type=None, start=None, end=None,
+              cursor=None, limit=DEFAULT_LIMIT, meter_id=None):
+        """Return one page of troubles or incidents ordered by timestamp
+
+        Returns (rows, next_cursor); next_cursor is None on the last page.
+        """
+        if kind == 'troubles':
+            table, columns = 'troubles', TROUBLE_COLUMNS
+        elif kind == 'incidents':
+            table, columns = 'incidents', INCIDENT_COLUMNS
+        else:
+            raise ValueError(f"Unknown kind: {kind}")
+        limit = max(1, min(int(limit), MAX_LIMIT))
+
+        clauses = []
+        params = []
+        if trouble_type:
+            clauses.append('trouble_type = ?')
+            params.append(trouble_type)
+        if meter_id:
+            clauses.append('meter_id = ?')
+            params.append(meter_id)
+        if start:
+            clauses.append('timestamp >= ?')
+            params.append(start)
+        if end:
+            clauses.append('timestamp <= ?')
+            params.append(end)
+        if cursor:
+            clauses.append('(timestamp, id) > (?, ?)')
+            params.extend(decode_cursor(cursor))
+
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY timestamp, id LIMIT ?'
+        params.append(limit + 1)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        items = [dict(zip(columns, row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor(last['timestamp'], last['id'])
+        return items, next_cursor